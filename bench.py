@@ -0,0 +1,473 @@
+# === Load generator for both web servers (CPython only) ===
+# Starts one of the apps on simulated hardware in a child process (or targets
+# a running device with --url), drives it with concurrent virtual clients that
+# replay what the real pages do, and writes throughput, latency percentiles,
+# error rate and server memory to a JSON file.
+#
+#     python3 bench.py dashboard --clients 20 --duration 30
+#     python3 bench.py game --clients 16 --speed 4 --out game.json
+#     python3 bench.py game --baseline game.json     # exit 1 on regression
+#     python3 bench.py dashboard --url http://192.168.4.1/
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+APPS = {"dashboard": "rgb_temp_message_webPage", "game": "game_chat_server_webpage"}
+DEFAULT_PORT = 8090
+
+
+# === Server side (child process) ===
+def _run_server(app, port, blocking, threaded, quiet, pipe):
+    import tracemalloc
+    tracemalloc.start()
+    os.environ["ESP32_SIM"] = "1"
+    os.environ["ESP32_PORT"] = str(port)
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    module = __import__(APPS[app])
+    if blocking:
+        module.USE_ASYNCIO = False
+    if threaded:
+        module.USE_THREAD = True
+
+    # The parent asks for memory figures over the pipe while main() serves
+    def control():
+        import resource
+        while True:
+            cmd = pipe.recv()
+            if cmd == "reset":
+                tracemalloc.reset_peak()
+                pipe.send(None)
+            elif cmd == "stats":
+                current, peak = tracemalloc.get_traced_memory()
+                pipe.send({"current_bytes": current, "peak_bytes": peak,
+                           "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+    threading.Thread(target=control, daemon=True).start()
+    module.main()
+
+
+def start_server(app, port, blocking=False, quiet=True, threaded=False):
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.get_context("spawn").Process(
+        target=_run_server, args=(app, port, blocking, threaded, quiet, child), daemon=True)
+    proc.start()
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, parent
+        except OSError:
+            if not proc.is_alive():
+                break
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not start on port %d" % port)
+
+
+def server_call(pipe, cmd):
+    pipe.send(cmd)
+    return pipe.recv() if pipe.poll(5) else None
+
+
+# === HTTP/1.1 client with one keep-alive connection per virtual user ===
+class Stats:
+    def __init__(self):
+        self.latencies = {}   # route -> [ms]
+        self.errors = {}      # route -> count
+        self.status = {}      # status code -> count
+        self.bytes = 0
+        self.recording = False
+
+    def record(self, route, ms, status, size):
+        if not self.recording:
+            return
+        self.latencies.setdefault(route, []).append(ms)
+        self.status[status] = self.status.get(status, 0) + 1
+        self.bytes += size
+        # 503/429 are the server shedding load, which is what we want to see
+        if status == "error" or status[0] == "5":
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class Client:
+    def __init__(self, host, port, stats, timeout, local=None):
+        self.host = host
+        self.port = port
+        self.local = local  # source address, so per-IP limits see separate clients
+        self.stats = stats
+        self.timeout = timeout
+        self.reader = self.writer = None
+        self.etags = {}
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    # Returns (status, headers, body); errors are recorded and give status "error"
+    async def get(self, path, route, method="GET", etag=False, data=None, key=None):
+        start = time.perf_counter()
+        try:
+            status, headers, body = await asyncio.wait_for(self._request(method, path, etag, data, key),
+                                                           self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            await self.close()
+            self.stats.record(route, (time.perf_counter() - start) * 1000, "error", 0)
+            return "error", {}, b""
+        self.stats.record(route, (time.perf_counter() - start) * 1000, status, len(body))
+        if etag and "etag" in headers:
+            self.etags[path] = headers["etag"]
+        return status, headers, body
+
+    # POST a JSON body; `key` goes out as the Idempotency-Key header
+    def post(self, path, route, data, key=None):
+        return self.get(path, route, "POST", data=data, key=key)
+
+    async def _request(self, method, path, etag, data=None, key=None):
+        if self.writer is None:
+            if self.local:
+                try:
+                    self.reader, self.writer = await asyncio.open_connection(
+                        self.host, self.port, local_addr=(self.local, 0))
+                except OSError:
+                    self.local = None  # no 127/8 aliases on this OS
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = "%s %s HTTP/1.1\r\nHost: %s\r\nAccept-Encoding: gzip\r\n" % (method, path, self.host)
+        if etag and path in self.etags:
+            head += "If-None-Match: %s\r\n" % self.etags[path]
+        if key:
+            head += "Idempotency-Key: %s\r\n" % key
+        payload = b""
+        if data is not None:
+            payload = json.dumps(data).encode()
+            head += "Content-Type: application/json\r\nContent-Length: %d\r\n" % len(payload)
+        self.writer.write((head + "\r\n").encode() + payload)
+        await self.writer.drain()
+
+        lines = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = lines[0].split(" ", 2)[1]
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+
+        if method == "HEAD" or status in ("204", "304"):
+            body = b""
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                body += (await self.reader.readexactly(size + 2))[:size]
+                if size == 0:
+                    break
+        else:
+            body = await self.reader.read()
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, headers, body
+
+
+def think(rng, seconds, speed):
+    return asyncio.sleep(seconds * rng.uniform(0.8, 1.2) / speed)
+
+
+def as_json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        return {}
+
+
+# === Dashboard traffic ===
+# Page viewer: loads the shell once, then polls /state every 5 s like the page
+async def viewer(client, rng, speed, n):
+    await client.get("/", "GET /", etag=True)
+    polls = 0
+    while True:
+        await think(rng, 5, speed)
+        await client.get("/state", "GET /state")
+        polls += 1
+        if polls % 6 == 0:
+            await client.get("/", "GET /", etag=True)  # a refresh hits the ETag
+
+
+# Someone using the forms: colors, effects and messages through /state
+async def controller(client, rng, speed, n):
+    await client.get("/", "GET /", etag=True)
+    while True:
+        await think(rng, 8, speed)
+        r, g, b = (rng.randrange(256) for _ in range(3))
+        choice = rng.random()
+        if choice < 0.4:
+            await client.get("/state?r=%d&g=%d&b=%d" % (r, g, b), "GET /state?color")
+        elif choice < 0.6:
+            await client.get("/state?r=%d&g=%d&b=%d&fx=%s&ms=1500" % (r, g, b, rng.choice(("fade", "blink", "pulse"))),
+                             "GET /state?fx")
+        elif choice < 0.9:
+            await client.get("/state?msg=Hello+%d" % rng.randrange(1000), "GET /state?msg")
+        else:
+            # No-JS form submit: 303 back to the shell
+            await client.get("/?r=%d&g=%d&b=%d&msg=Hi" % (r, g, b), "GET /?query")
+            await client.get("/", "GET /", etag=True)
+
+
+async def lite_viewer(client, rng, speed, n):
+    while True:
+        await client.get("/lite", "GET /lite")
+        await think(rng, 10, speed)
+
+
+async def history_reader(client, rng, speed, n):
+    while True:
+        await client.get("/sensor", "GET /sensor")
+        await client.get("/history?res=%s" % rng.choice(("raw", "minute", "hour")), "GET /history")
+        await think(rng, 30, speed)
+
+
+# === Dice Duel traffic ===
+# Players come in pairs sharing a room; both poll stats?since= every 2 s like
+# the page's fallback, roll when it is their turn, chat now and then and
+# restart when the game is over, all through the POST /api actions.
+async def player(client, rng, speed, n):
+    base = "/room/b%d/" % (n // 2)
+    slot = n % 2
+    state = {}
+
+    # Actions go through the JSON API like the page does; replies are deltas
+    async def act(action, data=None):
+        data = dict(data or {}, since=state.get("version", -1))
+        key = "%d-%d" % (n, rng.getrandbits(48))
+        status, headers, body = await client.post(base + "api/" + action, "POST /api/" + action, data, key)
+        if status == "200":
+            state.update(as_json(body))
+
+    await client.get(base, "GET /room/", etag=True)
+    await act("join", {"p%d_name" % (slot + 1): "P%d" % n})
+    while True:
+        await think(rng, 2, speed)
+        status, headers, body = await client.get(base + "stats?since=%d" % state.get("version", -1), "GET /stats")
+        if status != "200":
+            continue
+        state.update(as_json(body))
+        if state.get("game_over"):
+            if slot == 0:
+                await act("restart")
+        elif not state.get("game_started"):
+            if slot == 0 and state.get("p2_name"):
+                await act("start")
+        elif state.get("status", "").startswith("P%d'" % n):
+            await act("roll")
+        if rng.random() < 0.1:
+            await act("chat", {"msg": "gg %d" % rng.randrange(100)})
+        if rng.random() < 0.05:
+            await client.get(base + "chat?after=0", "GET /chat")
+
+
+async def lobby(client, rng, speed, n):
+    while True:
+        await client.get("/rooms", "GET /rooms")
+        await think(rng, 10, speed)
+
+
+SCENARIOS = {
+    "dashboard": ((viewer, 70), (controller, 20), (lite_viewer, 5), (history_reader, 5)),
+    "game": ((player, 90), (lobby, 10)),
+}
+
+
+def assign(app, clients, rng):
+    behaviours, weights = zip(*SCENARIOS[app])
+    if app == "game":
+        # Keep players paired: fill lobby slots first, then whole pairs
+        lobbies = max(0, round(clients * weights[1] / 100))
+        players = clients - lobbies
+        return [player] * players + [lobby] * lobbies
+    return [rng.choices(behaviours, weights)[0] for _ in range(clients)]
+
+
+# === Run ===
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 2)
+
+
+def summarize(latencies):
+    return {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99), "max": round(max(latencies), 2) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None}
+
+
+async def run_load(app, host, port, clients, duration, warmup, speed, timeout, seed, on_measure=None):
+    rng = random.Random(seed)
+    stats = Stats()
+    plan = assign(app, clients, rng)
+    users = []
+
+    async def user(n, behaviour):
+        # On loopback every virtual user gets its own source address (Linux
+        # routes all of 127.0.0.0/8 locally), like separate phones on the AP
+        local = "127.1.%d.%d" % (n // 250, n % 250 + 1) if host == "127.0.0.1" else None
+        client = Client(host, port, stats, timeout, local)
+        await asyncio.sleep(rng.random() * 2 / speed)  # stagger the arrivals
+        try:
+            await behaviour(client, random.Random(seed * 1000 + n), speed, n)
+        finally:
+            await client.close()
+
+    for n, behaviour in enumerate(plan):
+        users.append(asyncio.create_task(user(n, behaviour)))
+    await asyncio.sleep(warmup)
+    if on_measure:
+        on_measure()
+    stats.recording = True
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    stats.recording = False
+    elapsed = time.perf_counter() - started
+    for task in users:
+        task.cancel()
+    await asyncio.gather(*users, return_exceptions=True)
+    return stats, elapsed, [b.__name__ for b in plan]
+
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(args, stats, elapsed, plan, memory):
+    every = [ms for values in stats.latencies.values() for ms in values]
+    errors = sum(stats.errors.values())
+    routes = {}
+    for route in sorted(stats.latencies):
+        values = stats.latencies[route]
+        routes[route] = dict(summarize(values), count=len(values), errors=stats.errors.get(route, 0))
+    mix = {}
+    for name in plan:
+        mix[name] = mix.get(name, 0) + 1
+    return {
+        "app": args.app, "target": args.url or "simulated", "mode": ("blocking" if args.blocking else "asyncio") + ("+thread" if args.threaded else ""),
+        "revision": revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "clients": args.clients, "mix": mix, "duration_s": round(elapsed, 2), "speed": args.speed,
+        "requests": len(every), "errors": errors,
+        "error_rate": round(errors / len(every), 4) if every else None,
+        "throughput_rps": round(len(every) / elapsed, 2),
+        "bytes_received": stats.bytes,
+        "latency_ms": summarize(every), "routes": routes,
+        "status": dict(sorted(stats.status.items())),
+        "server_memory": memory,
+    }
+
+
+# Compares against an earlier result; returns the list of regressions
+def compare(result, baseline, tolerance, min_delta_ms=1):
+    problems = []
+    for key in ("p50", "p95", "p99"):
+        old, new = baseline["latency_ms"].get(key), result["latency_ms"].get(key)
+        if old and new and new > old * (1 + tolerance) and new - old > min_delta_ms:
+            problems.append("latency %s %.2f -> %.2f ms" % (key, old, new))
+    old, new = baseline.get("throughput_rps"), result.get("throughput_rps")
+    if old and new < old * (1 - tolerance):
+        problems.append("throughput %.1f -> %.1f req/s" % (old, new))
+    if (result.get("error_rate") or 0) > (baseline.get("error_rate") or 0) + 0.01:
+        problems.append("error rate %s -> %s" % (baseline.get("error_rate"), result.get("error_rate")))
+    old = (baseline.get("server_memory") or {}).get("peak_bytes")
+    new = (result.get("server_memory") or {}).get("peak_bytes")
+    if old and new and new > old * (1 + tolerance):
+        problems.append("server peak memory %d -> %d bytes" % (old, new))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard or Dice Duel server.")
+    parser.add_argument("app", choices=sorted(APPS))
+    parser.add_argument("--clients", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before measuring starts")
+    parser.add_argument("--speed", type=float, default=1, help="think-time divisor (2 = twice as eager)")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port for the simulated server")
+    parser.add_argument("--blocking", action="store_true", help="run the dashboard in blocking mode")
+    parser.add_argument("--threaded", action="store_true", help="move peripheral work to its own thread")
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's request log")
+    parser.add_argument("--out", default="bench-%s.json", help="result file (%%s = app)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--min-delta", type=float, default=1, help="latency changes below this many ms are noise")
+    args = parser.parse_args()
+    if args.blocking and args.app != "dashboard":
+        parser.error("--blocking: only the dashboard has a blocking mode")
+
+    proc = pipe = None
+    if args.url:
+        target = args.url.split("//", 1)[-1].split("/", 1)[0]
+        host, _, port = target.partition(":")
+        port = int(port or 80)
+    else:
+        host, port = "127.0.0.1", args.port
+        proc, pipe = start_server(args.app, port, args.blocking, not args.verbose, args.threaded)
+
+    try:
+        stats, elapsed, plan = asyncio.run(run_load(
+            args.app, host, port, args.clients, args.duration, args.warmup, args.speed, args.timeout,
+            args.seed, on_measure=(lambda: server_call(pipe, "reset")) if pipe else None))
+        memory = server_call(pipe, "stats") if pipe else None
+    finally:
+        if proc:
+            proc.terminate()
+            proc.join(5)
+
+    result = report(args, stats, elapsed, plan, memory)
+    out = args.out % args.app if "%s" in args.out else args.out
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    lat = result["latency_ms"]
+    print("%s: %d requests in %.1f s, %.1f req/s, %d errors (%.2f%%)" % (
+        args.app, result["requests"], elapsed, result["throughput_rps"], result["errors"],
+        100 * (result["error_rate"] or 0)))
+    print("latency ms: p50 %s  p95 %s  p99 %s  max %s" % (lat["p50"], lat["p95"], lat["p99"], lat["max"]))
+    for route, r in result["routes"].items():
+        print("  %-20s %6d  p50 %8s  p95 %8s  p99 %8s  err %d" % (
+            route, r["count"], r["p50"], r["p95"], r["p99"], r["errors"]))
+    if memory:
+        print("server memory: %d B current, %d B peak (tracemalloc), %d kB max RSS" % (
+            memory["current_bytes"], memory["peak_bytes"], memory["maxrss_kb"]))
+    print("results written to", out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(result, json.load(f), args.tolerance, args.min_delta)
+        for p in problems:
+            print("REGRESSION:", p)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# === Bounded chat log ===
+# Fixed-capacity ring of (seq, sender, text) entries. Sequence numbers keep
+# counting across wrap-around and clears, so a client cursor ("everything
+# after seq N") stays valid however long the game runs.
+CHAT_LOG_SIZE = 32
+FETCH_LIMIT = 20  # default and maximum lines per after() call
+
+
+class ChatLog:
+    def __init__(self, size=CHAT_LOG_SIZE):
+        self.size = size
+        self.seqs = [0] * size
+        self.senders = [""] * size
+        self.texts = [""] * size
+        self.head = 0   # next slot to write
+        self.count = 0
+        self.last_seq = 0
+
+    def append(self, sender, text):
+        self.last_seq += 1
+        i = self.head
+        self.seqs[i] = self.last_seq
+        self.senders[i] = sender
+        self.texts[i] = text
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        return self.last_seq
+
+    def clear(self):
+        self.count = 0
+
+    def first_seq(self):
+        return self.last_seq - self.count + 1
+
+    # Entries with seq > after, oldest first, at most `limit` of them
+    def after(self, after=0, limit=FETCH_LIMIT):
+        first = self.first_seq()
+        after = max(after, first - 1)
+        n = max(0, min(self.last_seq - after, limit, FETCH_LIMIT))
+        start = self.head - self.count + (after + 1 - first)
+        return [self._entry((start + k) % self.size) for k in range(n)]
+
+    def tail(self, n):
+        n = min(n, self.count)
+        return [self._entry((self.head - n + k) % self.size) for k in range(n)]
+
+    def _entry(self, i):
+        return self.seqs[i], self.senders[i], self.texts[i]
+
+
+def format_line(sender, text):
+    return f"{sender}: {text}" if sender else text
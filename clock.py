@@ -0,0 +1,35 @@
+# === Wall clock ===
+# Timestamps written to flash (sample log, match log) are Unix time, seconds
+# since 1970-01-01 UTC, on the ESP32 and on a desktop alike. The ESP32's
+# MicroPython counts from 2000-01-01 and its RTC restarts there after a power
+# cycle, so the clock only counts as set once it is past MIN_VALID; WifiLink
+# sets it over NTP when the station connects. Until then callers hold back or
+# flag anything stamped with it.
+import time
+
+# Seconds between the 1970 and 2000 epochs, added where time.time() counts from 2000
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+MIN_VALID = 1704067200  # 2024-01-01; an earlier reading means the RTC was never set
+
+
+def now():
+    return int(time.time()) + EPOCH_OFFSET
+
+
+def valid():
+    return now() >= MIN_VALID
+
+
+# Sets the RTC over NTP; True if the clock is set afterwards
+def sync():
+    try:
+        import ntptime
+    except ImportError:
+        return valid()  # no NTP client here (desktop): the host keeps time
+    try:
+        ntptime.settime()
+    except (OSError, OverflowError) as e:
+        print("NTP sync failed:", e)
+        return False
+    print("Clock set over NTP:", now())
+    return valid()
@@ -0,0 +1,352 @@
+# === Fleet collector for many dashboards (CPython only) ===
+# Scrapes /sensor (and, with --metrics, /metrics) from every listed board
+# concurrently, over one keep-alive connection per board. Each board has its
+# own timeout and schedule: failures back off exponentially up to
+# BACKOFF_MAX_S, so a dead board costs one attempt a minute, not a stalled
+# sweep. The latest reading per node is cached and served as one page (/),
+# as JSON (/fleet.json) and as fleet-wide rollups.
+#
+#     python3 collector.py http://192.168.1.50 http://192.168.1.51
+#     python3 collector.py --devices fleet.json     # ["http://...", {"name": "lab", "url": "http://..."}]
+#     python3 collector.py --sim 4                  # four simulated dashboards on local ports
+#     python3 collector.py --sim 4 --once           # one sweep, print the JSON and exit
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from bench import Client, Stats, as_json, start_server
+from template import Template
+from webserver import serve_async
+from metrics import Metrics
+
+INTERVAL_S = 5          # scrape period per healthy node
+TIMEOUT_S = 3           # per request, per node
+BACKOFF_MAX_S = 60
+MAX_AGE_S = 30          # older cached readings are left out of the rollups
+CONCURRENCY = 32        # scrapes in flight at once
+COLLECTOR_PORT = 8100
+SIM_PORT = 8200         # first port of the --sim dashboards
+# Unlabeled series kept from each board's /metrics
+METRIC_NAMES = ("heap_free_bytes", "sensor_errors_total", "wifi_connected", "http_connections_active",
+                "rate_limited_total")
+
+
+def parse_url(url):
+    target = url.split("//", 1)[-1].split("/", 1)[0]
+    host, _, port = target.partition(":")
+    return host, int(port or 80)
+
+
+def parse_metrics(text):
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in METRIC_NAMES:
+            try:
+                values[name] = float(value)
+            except ValueError:
+                pass
+    return values
+
+
+def number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# === One board ===
+class Node:
+    def __init__(self, name, url, interval=INTERVAL_S, timeout=TIMEOUT_S):
+        self.name = name
+        self.url = url
+        self.interval = interval
+        host, port = parse_url(url)
+        self.client = Client(host, port, Stats(), timeout)  # reused across scrapes
+        self.reading = None   # last /sensor payload
+        self.metrics = {}
+        self.updated = None   # time.time() of the last good scrape
+        self.latency_ms = None
+        self.failures = 0     # consecutive
+        self.last_error = None
+        self.scrapes = 0
+        self.errors = 0
+
+    async def fetch(self, path):
+        status, headers, body = await self.client.get(path, path)
+        if status != "200":
+            raise ValueError("%s %s" % (path, "unreachable" if status == "error" else "status " + status))
+        if headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    async def scrape(self, with_metrics=False):
+        self.scrapes += 1
+        start = time.perf_counter()
+        try:
+            reading = as_json(await self.fetch("/sensor"))
+            if "temp" not in reading:
+                raise ValueError("/sensor returned no reading")
+            if with_metrics:
+                self.metrics = parse_metrics((await self.fetch("/metrics")).decode())
+        except ValueError as e:
+            self.errors += 1
+            self.failures += 1
+            self.last_error = str(e)
+            return False
+        self.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.reading = reading
+        self.updated = time.time()
+        self.failures = 0
+        self.last_error = None
+        return True
+
+    # Seconds until the next scrape: the interval, doubled per consecutive failure
+    def delay(self):
+        if not self.failures:
+            return self.interval
+        return min(self.interval * 2 ** self.failures, BACKOFF_MAX_S) * random.uniform(0.8, 1.2)
+
+    def age_s(self):
+        return None if self.updated is None else round(time.time() - self.updated, 1)
+
+    def status(self):
+        reading = self.reading or {}
+        derived = reading.get("derived") or {}
+        age = self.age_s()
+        return {
+            "name": self.name,
+            "url": self.url,
+            "online": self.failures == 0 and age is not None and age <= MAX_AGE_S,
+            "temp": reading.get("temp"),
+            "hum": reading.get("hum"),
+            "weather": reading.get("weather"),
+            "dew_point": derived.get("dew_point"),
+            "heat_index": derived.get("heat_index"),
+            "age_s": age,
+            "latency_ms": self.latency_ms,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "metrics": self.metrics,
+        }
+
+
+# === Fleet ===
+class Collector:
+    def __init__(self, nodes, with_metrics=False, concurrency=CONCURRENCY):
+        self.nodes = nodes
+        self.with_metrics = with_metrics
+        self.concurrency = concurrency
+        self.sweeps = 0
+
+    async def _scrape(self, node, slots):
+        async with slots:
+            await node.scrape(self.with_metrics)
+
+    # Background task per node; the semaphore bounds the scrapes in flight
+    async def _watch(self, node, slots):
+        await asyncio.sleep(random.uniform(0, node.interval))  # spread the first sweep
+        while True:
+            await self._scrape(node, slots)
+            await asyncio.sleep(node.delay())
+
+    def tasks(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        return [self._watch(node, slots) for node in self.nodes]
+
+    async def sweep(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._scrape(node, slots) for node in self.nodes))
+        self.sweeps += 1
+
+    async def close(self):
+        for node in self.nodes:
+            await node.client.close()
+
+    def rollup(self, statuses):
+        fresh = [s for s in statuses if s["online"] and number(s["temp"]) and number(s["hum"])]
+        summary = {"nodes": len(statuses), "online": sum(1 for s in statuses if s["online"]),
+                   "reporting": len(fresh), "weather": {}}
+        for s in fresh:
+            summary["weather"][s["weather"]] = summary["weather"].get(s["weather"], 0) + 1
+        for field in ("temp", "hum"):
+            if not fresh:
+                summary[field] = None
+                continue
+            low = min(fresh, key=lambda s: s[field])
+            high = max(fresh, key=lambda s: s[field])
+            summary[field] = {"min": low[field], "min_node": low["name"],
+                              "avg": round(sum(s[field] for s in fresh) / len(fresh), 1),
+                              "max": high[field], "max_node": high["name"]}
+        return summary
+
+    def snapshot(self):
+        statuses = [node.status() for node in self.nodes]
+        return {"timestamp": int(time.time()), "fleet": self.rollup(statuses), "nodes": statuses}
+
+
+# === Aggregated view ===
+PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+    <title>ESP32 Fleet</title>
+    <meta http-equiv="refresh" content="{{refresh}}">
+    <style>
+        body { font-family: 'Arial', sans-serif; background: linear-gradient(135deg, #1e1e2f, #2a4066);
+               color: #fff; margin: 0; padding: 20px; min-height: 100vh; }
+        h2 { text-align: center; color: #00f05c; text-shadow: 0 0 10px rgba(0, 240, 92, 0.8); }
+        .summary { text-align: center; color: #e0e0e0; margin-bottom: 20px; }
+        table { margin: auto; border-collapse: collapse; background: rgba(255, 255, 255, 0.1); }
+        th, td { padding: 8px 14px; text-align: left; }
+        th { color: #00f05c; border-bottom: 1px solid rgba(0, 240, 92, 0.4); }
+        tr.offline td { color: #ff6b6b; }
+        a { color: #00f05c; }
+    </style>
+</head>
+<body>
+    <h2>ESP32 Fleet</h2>
+    <p class="summary">{{summary|html}}</p>
+    <table>
+        <tr><th>Node</th><th>Temp (C)</th><th>Humidity (%)</th><th>Weather</th><th>Feels Like</th><th>Age (s)</th><th>Status</th></tr>
+        {{rows}}
+    </table>
+    <p class="summary"><a href="/fleet.json">JSON</a></p>
+</body>
+</html>""")
+
+ROW = Template('<tr class="{{cls}}"><td><a href="{{url|html}}">{{name|html}}</a></td><td>{{temp|html}}</td>'
+               '<td>{{hum|html}}</td><td>{{weather|html}}</td><td>{{feels|html}}</td><td>{{age|html}}</td>'
+               '<td>{{state|html}}</td></tr>')
+
+
+def dash(value):
+    return "--" if value is None else value
+
+
+def summary_line(fleet):
+    text = "%d of %d nodes online" % (fleet["online"], fleet["nodes"])
+    if fleet["temp"]:
+        text += ", temp %s / %s / %s C, humidity %s / %s / %s %% (min / avg / max)" % (
+            fleet["temp"]["min"], fleet["temp"]["avg"], fleet["temp"]["max"],
+            fleet["hum"]["min"], fleet["hum"]["avg"], fleet["hum"]["max"])
+    return text
+
+
+def render_page(snapshot, refresh):
+    rows = []
+    for s in snapshot["nodes"]:
+        state = "online" if s["online"] else s["last_error"] or "stale"
+        rows.append(b"".join(ROW.render(cls="" if s["online"] else "offline", url=s["url"], name=s["name"],
+                                        temp=dash(s["temp"]), hum=dash(s["hum"]), weather=dash(s["weather"]),
+                                        feels=dash(s["heat_index"]), age=dash(s["age_s"]), state=state)).decode())
+    return PAGE.render(refresh=refresh, summary=summary_line(snapshot["fleet"]), rows="\n        ".join(rows))
+
+
+def make_handler(collector, metrics, refresh):
+    def handle_request(req):
+        if req.path == "/fleet.json":
+            return "200 OK", "application/json", json.dumps(collector.snapshot()), {"Cache-Control": "no-store"}
+        if req.path == "/metrics":
+            return metrics.reply()
+        if req.path == "/":
+            return "200 OK", "text/html", render_page(collector.snapshot(), refresh)
+        return "404 Not Found", "text/plain", "Not Found"
+    return handle_request
+
+
+# === Simulated boards for local testing ===
+# Each board keeps its sample log and Wi-Fi cache in its own directory
+# Started boards go into `procs` as (process, control pipe) right away, so a
+# failure halfway still leaves the caller able to stop them
+def start_simulated(count, base_port, workdir, procs):
+    cwd = os.getcwd()
+    try:
+        for i in range(count):
+            board_dir = os.path.join(workdir, str(i))
+            os.mkdir(board_dir)
+            os.chdir(board_dir)
+            procs.append(start_server("dashboard", base_port + i))
+    finally:
+        os.chdir(cwd)
+    return ["http://127.0.0.1:%d/" % (base_port + i) for i in range(count)]
+
+
+def load_devices(path):
+    with open(path) as f:
+        entries = json.load(f)
+    return [(e, e) if isinstance(e, str) else (e.get("name") or e["url"], e["url"]) for e in entries]
+
+
+def collect(args, nodes):
+    collector = Collector(nodes, args.metrics, args.concurrency)
+    if args.once:
+        async def once():
+            await collector.sweep()
+            await collector.close()
+        asyncio.run(once())
+        snapshot = collector.snapshot()
+        print(json.dumps(snapshot, indent=2))
+        if snapshot["fleet"]["online"] < len(nodes):
+            sys.exit(1)
+        return
+
+    metrics = Metrics()
+    metrics.value("fleet_nodes", lambda: len(nodes), "Nodes being scraped.")
+    metrics.value("fleet_nodes_online", lambda: sum(1 for n in nodes if n.status()["online"]),
+                  "Nodes with a fresh reading.")
+    metrics.value("fleet_scrapes_total", lambda: {n.name: n.scrapes for n in nodes}, "Scrapes per node.",
+                  "counter", label="node")
+    metrics.value("fleet_scrape_errors_total", lambda: {n.name: n.errors for n in nodes},
+                  "Failed scrapes per node.", "counter", label="node")
+    asyncio.run(serve_async(make_handler(collector, metrics, max(int(args.interval), 1)), args.host, args.port,
+                            background=collector.tasks(), metrics=metrics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect and aggregate readings from many ESP32 dashboards.")
+    parser.add_argument("urls", nargs="*", help="dashboard base URLs")
+    parser.add_argument("--devices", help="JSON list of URLs or {name, url} objects")
+    parser.add_argument("--sim", type=int, default=0, help="start this many simulated dashboards")
+    parser.add_argument("--sim-port", type=int, default=SIM_PORT, help="first port of the simulated dashboards")
+    parser.add_argument("--interval", type=float, default=INTERVAL_S, help="seconds between scrapes per node")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_S, help="per-request timeout in seconds")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="scrapes in flight at once")
+    parser.add_argument("--metrics", action="store_true", help="also scrape each board's /metrics")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=COLLECTOR_PORT, help="port of the aggregated view")
+    parser.add_argument("--once", action="store_true", help="scrape every node once, print JSON and exit")
+    args = parser.parse_args()
+
+    devices = [(url, url) for url in args.urls]
+    if args.devices:
+        devices += load_devices(args.devices)
+    if not devices and not args.sim:
+        parser.error("no devices: pass URLs, --devices or --sim")
+
+    # Stopping with SIGTERM still shuts the simulated boards down and removes their files
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    procs = []
+    workdir = tempfile.mkdtemp(prefix="esp32-fleet-") if args.sim else None
+    try:
+        if args.sim:
+            urls = start_simulated(args.sim, args.sim_port, workdir, procs)
+            devices += [("sim-%d" % (i + 1), url) for i, url in enumerate(urls)]
+        collect(args, [Node(name, url, args.interval, args.timeout) for name, url in devices])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc, _ in procs:
+            proc.terminate()
+            proc.join(5)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# === MicroPython / CPython compatibility shims ===
+# Lets the shared modules run unchanged on the ESP32 and on a desktop Python.
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+    ticks_add = time.ticks_add
+except AttributeError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def ticks_add(t, delta):
+        return t + delta
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
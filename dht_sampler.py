@@ -0,0 +1,113 @@
+# === Background DHT sampler ===
+# Owns the DHT sensor, reads it on its own schedule and caches the last good
+# reading, so page renders and JSON endpoints never wait on the sensor bus.
+import clock
+from compat import ticks_ms, ticks_us, ticks_diff, sleep_ms
+
+MIN_INTERVAL_MS = 1000  # the DHT11 cannot be sampled faster than about once a second
+
+
+class DHTSampler:
+    def __init__(self, sensor, interval_ms=2000, retries=2, retry_delay_ms=MIN_INTERVAL_MS,
+                 max_age_ms=60000, metrics=None):
+        self.sensor = sensor
+        self.metrics = metrics  # optional metrics.Metrics; times each bus read
+        self.interval_ms = max(interval_ms, MIN_INTERVAL_MS)
+        self.retries = retries
+        self.retry_delay_ms = max(retry_delay_ms, MIN_INTERVAL_MS)
+        self.max_age_ms = max_age_ms  # older readings are reported as "Error"
+
+        # Last good reading
+        self.temp = None
+        self.hum = None
+        self.timestamp = None  # Unix time of the last good reading (see clock.py)
+        self._sampled_ticks = None
+
+        # Counters
+        self.reads = 0
+        self.retry_count = 0
+        self.errors = 0
+        self.last_error = None
+
+        self._retries_left = retries
+        self._delay_ms = 0
+        self._attempt_ticks = None
+        self._listeners = []
+
+    # fn(timestamp, temp, hum) is called once per good reading
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def _attempt(self):
+        self._attempt_ticks = ticks_ms()
+        started = ticks_us()
+        try:
+            self.sensor.measure()
+            temp = self.sensor.temperature()
+            hum = self.sensor.humidity()
+        except Exception as e:
+            if self.metrics:
+                self.metrics.phase("sensor", started)
+            self.last_error = str(e)
+            if self._retries_left > 0:
+                self._retries_left -= 1
+                self.retry_count += 1
+                self._delay_ms = self.retry_delay_ms
+            else:
+                self.errors += 1
+                self._retries_left = self.retries
+                self._delay_ms = self.interval_ms
+                print("DHT Error:", e)
+            return False
+
+        if self.metrics:
+            self.metrics.phase("sensor", started)
+        self.temp = temp
+        self.hum = hum
+        self.timestamp = clock.now()
+        self._sampled_ticks = self._attempt_ticks
+        self.reads += 1
+        self._retries_left = self.retries
+        self._delay_ms = self.interval_ms
+        for fn in self._listeners:
+            try:
+                fn(self.timestamp, temp, hum)
+            except Exception as e:
+                print("Sampler listener error:", e)
+        return True
+
+    # Blocking mode: call between requests, reads only when a sample is due
+    def poll(self):
+        if self._attempt_ticks is None or ticks_diff(ticks_ms(), self._attempt_ticks) >= self._delay_ms:
+            return self._attempt()
+        return False
+
+    # asyncio mode: run as a background task
+    async def run(self):
+        while True:
+            self._attempt()
+            await sleep_ms(self._delay_ms)
+
+    def age_ms(self):
+        if self._sampled_ticks is None:
+            return None
+        return ticks_diff(ticks_ms(), self._sampled_ticks)
+
+    def reading(self):
+        age = self.age_ms()
+        if age is None or age > self.max_age_ms:
+            return "Error", "Error"
+        return self.temp, self.hum
+
+    def status(self):
+        temp, hum = self.reading()
+        return {
+            "temp": temp,
+            "hum": hum,
+            "timestamp": self.timestamp,
+            "age_ms": self.age_ms(),
+            "reads": self.reads,
+            "retries": self.retry_count,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,220 @@
+# === Dice Duel rooms ===
+# Each Room holds one match: two players, their rolls, the turn, the chat and
+# the game flags, plus its own versioned snapshot and SSE hub. RoomRegistry
+# maps room ids to rooms (O(1) dict lookup) and evicts rooms left idle.
+import json
+import random
+from compat import ticks_ms, ticks_diff, sleep_ms
+from state_cache import VersionedState
+from webserver import EventHub
+from chat_log import ChatLog, format_line
+from template import escape_html
+
+DEFAULT_ROOM = "main"      # served at / and never evicted
+MAX_ROOMS = 24
+ROOM_IDLE_MS = 30 * 60 * 1000
+ROOM_ID_MAX = 12
+MAX_ROLLS = 6
+NAME_MAX = 10
+CHAT_MAX = 20
+
+
+def valid_room_id(room_id):
+    if not room_id or len(room_id) > ROOM_ID_MAX:
+        return False
+    for c in room_id:
+        if not (c.isalpha() or c.isdigit() or c in "-_"):
+            return False
+    return True
+
+
+class Room:
+    __slots__ = ("id", "names", "rolls", "scores", "current", "chat_log",
+                 "game_started", "game_over", "last_active", "state", "events", "notify", "on_result")
+
+    def __init__(self, room_id, notify=None, on_result=None):
+        self.id = room_id
+        self.notify = notify  # called with each message that goes to the OLED
+        self.on_result = on_result  # called with the room when a match ends
+        self.names = [None, None]
+        self.rolls = [bytearray(), bytearray()]
+        self.scores = [0, 0]
+        self.current = 0
+        self.chat_log = ChatLog()
+        self.game_started = False
+        self.game_over = False
+        self.last_active = ticks_ms()
+        self.events = EventHub()
+        self.state = VersionedState(self.stats)
+
+    def _say(self, message, sender="", chat=True):
+        if chat:
+            self.chat_log.append(sender, message)
+        if self.notify:
+            self.notify(format_line(sender, message))
+
+    # === Game Logic ===
+    def join(self, slot, name):
+        if not self.names[slot]:
+            self.names[slot] = name[:NAME_MAX]
+            self._say(f"{self.names[slot]} joined!")
+
+    def start(self):
+        if self.names[0] and self.names[1] and not self.game_started:
+            self.game_started = True
+            self._say("Game Started!")
+
+    def roll(self):
+        if not self.game_started or self.game_over:
+            return
+        p = self.current
+        if len(self.rolls[p]) < MAX_ROLLS:
+            dice_result = random.randint(1, 6)
+            self.rolls[p].append(dice_result)
+            self.scores[p] += dice_result
+            self._say(str(dice_result), sender=self.names[p])
+            self.current = 1 - p
+        if len(self.rolls[0]) == MAX_ROLLS and len(self.rolls[1]) == MAX_ROLLS:
+            self.game_over = True
+            self._say(self.winner())
+            if self.on_result:
+                self.on_result(self)
+
+    def chat(self, text):
+        if self.game_started and not self.game_over:
+            self._say(text[:CHAT_MAX], sender=self.names[self.current])
+
+    def winner(self):
+        s1, s2 = self.scores
+        if s1 > s2:
+            return f"{self.names[0]} Wins! {s1}-{s2}"
+        elif s2 > s1:
+            return f"{self.names[1]} Wins! {s2}-{s1}"
+        return "Tie!"
+
+    def reset(self, full_reset=False):
+        if full_reset:
+            self.names = [None, None]
+            self.chat_log.clear()
+        else:
+            self.chat_log.append("", "Game Restarted!")
+        self.rolls = [bytearray(), bytearray()]
+        self.scores = [0, 0]
+        self.current = 0
+        self.game_started = not full_reset
+        self.game_over = False
+
+    def restart(self):
+        if self.game_over:
+            self.reset()
+            self._say("Game Restarted!", chat=False)
+
+    def exit(self):
+        if self.game_over:
+            self.reset(full_reset=True)
+            self._say("Game Exited!", chat=False)
+
+    def touch(self):
+        self.last_active = ticks_ms()
+
+    # Applies the form parameters of one request, in the original order
+    def apply(self, params):
+        self.touch()
+        if 'p1_name' in params:
+            self.join(0, params['p1_name'])
+        if 'p2_name' in params:
+            self.join(1, params['p2_name'])
+        if params.get('start') == '1':
+            self.start()
+        if params.get('roll') == '1':
+            self.roll()
+        if 'chat_msg' in params:
+            self.chat(params['chat_msg'])
+        if params.get('restart') == '1':
+            self.restart()
+        if params.get('exit') == '1':
+            self.exit()
+        self.changed()
+
+    # === State ===
+    def stats(self):
+        if self.game_started and not self.game_over:
+            status = f"{self.names[self.current]}'s Turn"
+        elif not self.game_started:
+            status = "Join Game"
+        else:
+            status = self.winner()
+        return {"p1_name": self.names[0] or "",
+                "p1_rolls": ",".join(map(str, self.rolls[0])),
+                "p1_score": self.scores[0],
+                "p2_name": self.names[1] or "",
+                "p2_rolls": ",".join(map(str, self.rolls[1])),
+                "p2_score": self.scores[1],
+                # The page shows this as HTML; names and messages are user text
+                "chat": "<br>".join(escape_html(format_line(sender, text))
+                                    for _, sender, text in self.chat_log.tail(5)),
+                "chat_seq": self.chat_log.last_seq,
+                "game_started": self.game_started,
+                "game_over": self.game_over,
+                "status": status}
+
+    # Bumps the version and pushes the changed fields to open /events streams
+    def changed(self):
+        delta = self.state.bump()
+        if delta:
+            delta["version"] = self.state.version
+            self.events.publish(json.dumps(delta))
+
+    def idle_ms(self):
+        return ticks_diff(ticks_ms(), self.last_active)
+
+    # Chat lines after a client's cursor, for /chat?after=<seq>&limit=<n>
+    def chat_since(self, after, limit):
+        log = self.chat_log
+        return {"first_seq": log.first_seq(),
+                "last_seq": log.last_seq,
+                "messages": [{"seq": seq, "sender": sender, "text": text}
+                             for seq, sender, text in log.after(after, limit)]}
+
+
+class RoomRegistry:
+    def __init__(self, notify=None, max_rooms=MAX_ROOMS, idle_ms=ROOM_IDLE_MS, on_result=None):
+        self.notify = notify
+        self.on_result = on_result
+        self.max_rooms = max_rooms
+        self.idle_limit_ms = idle_ms
+        self.rooms = {DEFAULT_ROOM: Room(DEFAULT_ROOM, notify, on_result)}
+
+    # Existing room, a new one if create is set, or None (unknown id or full)
+    def get(self, room_id, create=False):
+        room = self.rooms.get(room_id)
+        if room is not None or not create or not valid_room_id(room_id):
+            return room
+        if len(self.rooms) >= self.max_rooms:
+            self.evict_idle()
+            if len(self.rooms) >= self.max_rooms:
+                return None
+        room = Room(room_id, self.notify, self.on_result)
+        self.rooms[room_id] = room
+        print("Room created:", room_id)
+        return room
+
+    # Drops rooms with no activity and no open /events stream
+    def evict_idle(self):
+        for room_id in list(self.rooms):
+            room = self.rooms[room_id]
+            if room_id != DEFAULT_ROOM and not room.events.clients and room.idle_ms() > self.idle_limit_ms:
+                del self.rooms[room_id]
+                print("Room evicted:", room_id)
+
+    async def run(self, every_ms=60000):
+        while True:
+            await sleep_ms(every_ms)
+            self.evict_idle()
+
+    def summary(self):
+        return [{"id": room.id,
+                 "players": [n for n in room.names if n],
+                 "game_started": room.game_started,
+                 "game_over": room.game_over,
+                 "idle_s": room.idle_ms() // 1000} for room in self.rooms.values()]
@@ -0,0 +1,85 @@
+# === Coalescing OLED text display ===
+# Request handlers only record the text they want on each line; a background
+# flush draws it later. Bursts of updates collapse into one frame, lines that
+# did not change are not redrawn, and only the SSD1306 pages (8-pixel bands)
+# under changed lines are sent over I2C instead of the whole framebuffer.
+from compat import sleep_ms, ticks_us
+
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+FLUSH_INTERVAL_MS = 100
+LINE_HEIGHT = 8
+
+
+class TextDisplay:
+    def __init__(self, oled, line_y=(0, 20, 40), width=128, interval_ms=FLUSH_INTERVAL_MS,
+                 metrics=None):
+        self.oled = oled
+        self.metrics = metrics  # optional metrics.Metrics; times each frame
+        self.line_y = line_y  # top pixel row of each text line
+        self.width = width
+        self.interval_ms = interval_ms
+        self.wanted = [""] * len(line_y)
+        self.shown = [None] * len(line_y)  # None forces the first draw
+        self.dirty = True
+        self.cleared = False  # the first frame clears and sends the whole screen
+        self.frames = 0    # flushes that sent something
+        self.skipped = 0   # updates that changed nothing
+
+    # Queue text for one line; cheap enough to call from a request handler
+    def set(self, line, text):
+        if self.wanted[line] != text:
+            self.wanted[line] = text
+            self.dirty = True
+        else:
+            self.skipped += 1
+
+    def set_lines(self, *lines):
+        for i, text in enumerate(lines):
+            self.set(i, text)
+
+    # Draws changed lines and sends the pages they cover; False if nothing to do
+    def flush(self):
+        if not self.dirty:
+            return False
+        self.dirty = False
+        started = ticks_us()
+        if not self.cleared:
+            self.oled.fill(0)
+        first_page = last_page = None
+        for i, text in enumerate(self.wanted):
+            if text == self.shown[i]:
+                continue
+            y = self.line_y[i]
+            self.oled.fill_rect(0, y, self.width, LINE_HEIGHT, 0)
+            self.oled.text(text, 0, y)
+            self.shown[i] = text
+            top = y // 8
+            bottom = (y + LINE_HEIGHT - 1) // 8
+            first_page = top if first_page is None else min(first_page, top)
+            last_page = bottom if last_page is None else max(last_page, bottom)
+        if not self.cleared:
+            self.cleared = True
+            self.oled.show()
+        elif first_page is None:
+            return False
+        else:
+            self._send_pages(first_page, last_page)
+        if self.metrics:
+            self.metrics.phase("display", started)
+        self.frames += 1
+        return True
+
+    def _send_pages(self, first, last):
+        oled = self.oled
+        if not hasattr(oled, "write_data"):
+            oled.show()
+            return
+        for cmd in (SET_COL_ADDR, 0, self.width - 1, SET_PAGE_ADDR, first, last):
+            oled.write_cmd(cmd)
+        oled.write_data(memoryview(oled.buffer)[first * self.width:(last + 1) * self.width])
+
+    async def run(self):
+        while True:
+            self.flush()
+            await sleep_ms(self.interval_ms)
@@ -1,83 +1,84 @@
-import network
-import socket
-import machine
-import random
-import ssd1306
-import time
+import json
+from compat import asyncio
+from webserver import serve_async, connections
+from rate_limit import RateLimiter
+from static_asset import StaticAsset
+from display import TextDisplay
+from hal import network, machine, ssd1306, HTTP_HOST, HTTP_PORT
+from dice_rooms import RoomRegistry, DEFAULT_ROOM, valid_room_id
+from state_cache import ReplyCache
+from chat_log import FETCH_LIMIT
+from match_store import MatchStore, TOP_DEFAULT
+from metrics import Metrics
+from wifi import BootTimer, WifiLink
+from peripherals import PeripheralWorker, MetricsRelay
 
 # WiFi Setup
 SSID = "TampleDiago"
 PASSWORD = "12345689"
-sta = network.WLAN(network.STA_IF)
-sta.active(True)
-sta.connect(SSID, PASSWORD)
-while not sta.isconnected():
-    time.sleep(1)
-print("Connected! IP:", sta.ifconfig()[0])
-
 ssid_ap = "Muneeb1368"
 password_ap = "12345678"
+boot = BootTimer()
+sta = network.WLAN(network.STA_IF)
 ap = network.WLAN(network.AP_IF)
-ap.active(True)
-ap.config(essid=ssid_ap, password=password_ap, authmode=network.AUTH_WPA2_PSK)
-print("AP Active, IP:", ap.ifconfig()[0])
+
+# AP first, station in the background; see wifi.py
+wifi = WifiLink(sta, ap, SSID, PASSWORD, ssid_ap, password_ap, network.AUTH_WPA2_PSK, boot=boot)
+
+# Metrics (served on /metrics); room URLs are grouped by their sub-path
+metrics = Metrics(route_of=lambda req: split_room_path(req.path)[1] or "/room")
 
 # OLED Setup
 i2c = machine.SoftI2C(scl=machine.Pin(9), sda=machine.Pin(8))
 oled = ssd1306.SSD1306_I2C(128, 64, i2c)
 
-def update_oled(message):
-    oled.fill(0)
-    oled.text("Dice Game:", 0, 0)
-    oled.text(message[:16], 0, 20)
-    oled.text(message[16:32], 0, 40)
-    oled.show()
-    print("OLED:", message)
+# Handlers queue text; the display redraws changed lines on its own schedule
+display = TextDisplay(oled, line_y=(0, 20, 40), metrics=metrics)
+
+def show_message(message):
+    display.set_lines("Dice Game:", message[:16], message[16:32])
 
-# Game Logic
-players = {"P1": {"name": None, "rolls": [], "score": 0},
-           "P2": {"name": None, "rolls": [], "score": 0}}
-current_player = "P1"
-chat_history = []
-game_started = False
-game_over = False
+# Threaded mode: a second thread owns the OLED and draws queued messages
+USE_THREAD = False
+worker = PeripheralWorker(loop_ms=display.interval_ms)
+worker.every_loop(display.flush)
+display.metrics = MetricsRelay(worker, metrics)  # frame timings are recorded on the network side
 
-def roll_dice():
-    return random.randint(1, 6)
+def update_oled(message):
+    if worker.running:
+        worker.submit(show_message, message)
+    else:
+        show_message(message)
+    print("OLED:", message)
 
-def switch_player():
-    global current_player
-    current_player = "P2" if current_player == "P1" else "P1"
+# Joins, rolls, chat and restarts: a burst of 6, then 2 per second per client IP
+limiter = RateLimiter()
 
-def determine_winner():
-    p1_score = players["P1"]["score"]
-    p2_score = players["P2"]["score"]
-    if p1_score > p2_score:
-        return f"{players['P1']['name']} Wins! {p1_score}-{p2_score}"
-    elif p2_score > p1_score:
-        return f"{players['P2']['name']} Wins! {p2_score}-{p1_score}"
-    return "Tie!"
+# Finished matches go to the flash log; the leaderboard is updated per match
+matches = MatchStore()
 
-def reset_game(full_reset=False):
-    global players, current_player, chat_history, game_started, game_over
-    if full_reset:
-        players = {"P1": {"name": None, "rolls": [], "score": 0},
-                   "P2": {"name": None, "rolls": [], "score": 0}}
-        chat_history = []
-    else:
-        players["P1"]["rolls"] = []
-        players["P2"]["rolls"] = []
-        players["P1"]["score"] = 0
-        players["P2"]["score"] = 0
-        chat_history.append("Game Restarted!")
-    current_player = "P1"
-    game_started = not full_reset
-    game_over = False
+# Game Rooms: "main" is served at /, other matches live under /room/<id>/
+rooms = RoomRegistry(notify=update_oled, on_result=matches.room_finished)
 
-# Game Stats JSON
-def game_stats_json():
-    status = f"{players[current_player]['name']}'s Turn" if game_started and not game_over else "Join Game" if not game_started else determine_winner()
-    return f'{{"p1_name": "{players["P1"]["name"] or ""}", "p1_rolls": "{",".join(map(str, players["P1"]["rolls"]))}", "p1_score": {players["P1"]["score"]}, "p2_name": "{players["P2"]["name"] or ""}", "p2_rolls": "{",".join(map(str, players["P2"]["rolls"]))}", "p2_score": {players["P2"]["score"]}, "chat": "{"<br>".join(chat_history[-5:])}", "game_started": {str(game_started).lower()}, "game_over": {str(game_over).lower()}, "status": "{status}"}}'
+metrics.value("rooms_active", lambda: len(rooms.rooms), "Open game rooms.")
+metrics.value("sse_clients", lambda: sum(len(r.events.clients) for r in rooms.rooms.values()),
+              "Open /events streams.")
+metrics.value("oled_frames_total", lambda: display.frames, "OLED frames sent.", "counter")
+metrics.value("peripheral_commands_total", lambda: worker.commands, "Commands run by the peripheral thread.",
+              "counter")
+metrics.value("http_connections_active", lambda: connections["active"], "Open client connections.")
+metrics.value("http_connections_rejected_total", lambda: connections["rejected"],
+              "Connections refused with 503 at the connection or stream cap.", "counter")
+metrics.value("http_timeouts_total", lambda: connections["timeouts"], "Clients dropped for stalling.", "counter")
+metrics.value("rate_limited_total", lambda: limiter.limited, "Actions refused with 429.", "counter")
+metrics.value("api_replays_total", lambda: api_replies.hits, "Actions answered from the idempotency cache.",
+              "counter")
+metrics.value("matches_total", lambda: matches.matches, "Finished matches.", "counter")
+metrics.value("match_log_bytes", lambda: matches.size, "Match log size on flash.")
+metrics.value("boot_phase_ms", lambda: boot.phases, "Milliseconds from start to each boot phase.",
+              label="phase")
+metrics.value("wifi_connected", lambda: int(wifi.state == "connected"), "Station link up.")
+metrics.value("wifi_attempts_total", lambda: wifi.attempts, "Station connection attempts.", "counter")
 
 # Webpage
 def webpage():
@@ -194,7 +195,7 @@ def webpage():
 <body>
     <h1>Dice Duel</h1>
     <div class="join" id="join">
-        <form action="/" method="GET">
+        <form action="." method="GET" data-action="join">
             <p><input id="p1_name" name="p1_name" placeholder="Player 1" maxlength="10"></p>
             <p><input id="p2_name" name="p2_name" placeholder="Player 2" maxlength="10"></p>
             <button type="submit" id="startButton" name="start" value="1">Start</button>
@@ -202,13 +203,13 @@ def webpage():
     </div>
     <div class="game-container" id="gameContainer">
         <div class="game">
-            <form action="/" method="GET">
+            <form action="." method="GET" data-action="roll">
                 <button type="submit" id="rollButton" name="roll" value="1">Roll</button>
             </form>
-            <form action="/" method="GET">
+            <form action="." method="GET" data-action="restart">
                 <button type="submit" id="restartButton" name="restart" value="1" style="display: none;">Restart</button>
             </form>
-            <form action="/" method="GET">
+            <form action="." method="GET" data-action="exit">
                 <button type="submit" id="exitButton" name="exit" value="1" style="display: none;">Exit</button>
             </form>
             <div class="stats">
@@ -218,7 +219,7 @@ def webpage():
             </div>
         </div>
         <div class="chat">
-            <form action="/" method="GET">
+            <form action="." method="GET" data-action="chat">
                 <p><input id="chat_msg" name="chat_msg" placeholder="Message" maxlength="20"></p>
                 <button type="submit" id="chatButton">Send</button>
             </form>
@@ -226,94 +227,259 @@ def webpage():
         </div>
     </div>
     <script>
+        let state = {};
+        function render(data) {
+            document.getElementById('join').style.display = data.game_started ? 'none' : 'block';
+            document.getElementById('gameContainer').style.display = data.game_started ? 'flex' : 'none';
+            if (data.game_started) {
+                document.getElementById('p1_name').disabled = true;
+                document.getElementById('p2_name').disabled = true;
+            }
+            document.getElementById('p1_name_display').innerText = data.p1_name;
+            document.getElementById('p1_rolls').innerText = data.p1_rolls || 'None';
+            document.getElementById('p1_score').innerText = data.p1_score;
+            document.getElementById('p2_name_display').innerText = data.p2_name;
+            document.getElementById('p2_rolls').innerText = data.p2_rolls || 'None';
+            document.getElementById('p2_score').innerText = data.p2_score;
+            document.getElementById('status').innerText = data.status;
+            document.getElementById('chat').innerHTML = data.chat || 'Welcome!';
+            document.getElementById('rollButton').disabled = !data.game_started || data.game_over;
+            document.getElementById('restartButton').style.display = data.game_over ? 'block' : 'none';
+            document.getElementById('exitButton').style.display = data.game_over ? 'block' : 'none';
+            document.getElementById('chatButton').disabled = !data.game_started || data.game_over;
+        }
+        function apply(data) {
+            if (data.version < state.version) state = {};
+            Object.assign(state, data);
+            render(state);
+        }
+        // Actions are one small POST; the reply carries only the changed fields.
+        // The idempotency key lets a request lost to the network be retried safely.
+        function post(action, body, key, tries) {
+            body.since = state.version === undefined ? -1 : state.version;
+            return fetch('api/' + action, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json', 'Idempotency-Key': key},
+                body: JSON.stringify(body)
+            }).then(response => response.ok ? response.json().then(data => {
+                        // An event stream may already have delivered something newer
+                        if (!(data.version < state.version)) apply(data);
+                        // A new room only exists after its first action
+                        if (events && events.readyState === EventSource.CLOSED) listen();
+                    }) : null,
+                    () => tries > 1 ? post(action, body, key, tries - 1) : null);
+        }
+        const actionBody = {
+            join: form => ({p1_name: form.p1_name.value, p2_name: form.p2_name.value, start: true}),
+            chat: form => ({msg: form.chat_msg.value})
+        };
+        document.querySelectorAll('form[data-action]').forEach(form => {
+            form.onsubmit = e => {
+                e.preventDefault();
+                const action = form.dataset.action;
+                const key = Date.now().toString(36) + Math.random().toString(36).slice(2);
+                post(action, actionBody[action] ? actionBody[action](form) : {}, key, 3);
+                if (action === 'chat') form.reset();
+            };
+        });
         function refreshGame() {
-            fetch('/stats')
+            // Only fields changed since the version we already hold come back
+            fetch('stats?since=' + (state.version === undefined ? -1 : state.version))
                 .then(response => response.json())
-                .then(data => {
-                    document.getElementById('join').style.display = data.game_started ? 'none' : 'block';
-                    document.getElementById('gameContainer').style.display = data.game_started ? 'flex' : 'none';
-                    if (data.game_started) {
-                        document.getElementById('p1_name').disabled = true;
-                        document.getElementById('p2_name').disabled = true;
-                    }
-                    document.getElementById('p1_name_display').innerText = data.p1_name;
-                    document.getElementById('p1_rolls').innerText = data.p1_rolls || 'None';
-                    document.getElementById('p1_score').innerText = data.p1_score;
-                    document.getElementById('p2_name_display').innerText = data.p2_name;
-                    document.getElementById('p2_rolls').innerText = data.p2_rolls || 'None';
-                    document.getElementById('p2_score').innerText = data.p2_score;
-                    document.getElementById('status').innerText = data.status;
-                    document.getElementById('chat').innerHTML = data.chat || 'Welcome!';
-                    document.getElementById('rollButton').disabled = !data.game_started || data.game_over;
-                    document.getElementById('restartButton').style.display = data.game_over ? 'block' : 'none';
-                    document.getElementById('exitButton').style.display = data.game_over ? 'block' : 'none';
-                    document.getElementById('chatButton').disabled = !data.game_started || data.game_over;
-                });
+                .then(apply);
+        }
+        let events = null;
+        function listen() {
+            // First event is the full state, later ones only carry changed fields
+            events = new EventSource('events');
+            events.onmessage = e => {
+                Object.assign(state, JSON.parse(e.data));
+                render(state);
+            };
+        }
+        if (window.EventSource) {
+            listen();
+        } else {
+            setInterval(refreshGame, 2000);
+            window.onload = refreshGame;
         }
-        setInterval(refreshGame, 2000);
-        window.onload = refreshGame;
     </script>
 </body>
 </html>"""
     return html
 
-# Server Loop
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-s.bind((sta.ifconfig()[0], 80))
-s.listen(5)
+# The page has no per-request content: encode and compress it once
+page = StaticAsset(webpage(), "text/html")
+
+# Request Handling
+def stats_response(room, req):
+    state = room.state
+    etag = state.etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if req.header("if-none-match") == etag:
+        return "304 Not Modified", "application/json", "", headers
+    params = req.query
+    if 'since' in params:
+        try:
+            since = int(params['since'])
+        except ValueError:
+            return "400 Bad Request", "text/plain", "since must be an integer"
+        return "200 OK", "application/json", json.dumps(state.since(since)), headers
+    return "200 OK", "application/json", state.json(), headers
+
+# === JSON action API: POST <room>/api/<action> ===
+# Each action maps its JSON fields onto the form parameters Room.apply takes.
+# The reply is the state delta since the "since" version in the body, with
+# the new version. An Idempotency-Key header makes retries safe: a repeated
+# key gets the stored reply and the action is not applied again.
+# Missing or null is empty text; any other non-string is a bad request
+def _text(data, key):
+    value = data.get(key)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise TypeError(key + " must be a string")
+    return value
+
+def _join_params(data):
+    params = {k: _text(data, k) for k in ("p1_name", "p2_name") if data.get(k)}
+    if data.get("start"):
+        params["start"] = "1"
+    return params
+
+def _chat_params(data):
+    msg = _text(data, "msg")
+    return {"chat_msg": msg} if msg else {}  # nothing to post
+
+API_ACTIONS = {
+    "join": _join_params,
+    "start": lambda data: {"start": "1"},
+    "roll": lambda data: {"roll": "1"},
+    "chat": _chat_params,
+    "restart": lambda data: {"restart": "1"},
+    "exit": lambda data: {"exit": "1"},
+}
+IDEMPOTENCY_KEY_MAX = 64
+api_replies = ReplyCache()
+
+def api_error(status, message):
+    return status, "application/json", json.dumps({"error": message})
 
-while True:
+def api_response(room, req, action):
+    if req.method != "POST":
+        return "405 Method Not Allowed", "application/json", json.dumps({"error": "use POST"}), {"Allow": "POST"}
+    key = req.header("idempotency-key")
+    if key:
+        if len(key) > IDEMPOTENCY_KEY_MAX:
+            return api_error("400 Bad Request", "idempotency key too long")
+        key = room.id + ":" + action + ":" + key
+        reply = api_replies.get(key)
+        if reply is not None:
+            return "200 OK", "application/json", reply, {"Cache-Control": "no-store", "Idempotent-Replayed": "true"}
     try:
-        conn, addr = s.accept()
-        request = conn.recv(1024).decode()
-        print("Request Received:\n", request)
+        data = req.json()
+        since = int(data.get("since", -1))
+        params = API_ACTIONS[action](data)
+    except (ValueError, TypeError, AttributeError, OverflowError):
+        return api_error("400 Bad Request", "invalid JSON body")
+    if not limiter.allow(req.client):
+        return limiter.reply(req.client)
+    room.apply(params)
+    reply = json.dumps(room.state.since(since))
+    if key:
+        api_replies.put(key, reply)
+    return "200 OK", "application/json", reply, {"Cache-Control": "no-store"}
 
-        if "favicon.ico" in request:
-            conn.send("HTTP/1.1 404 Not Found\r\n\r\n")
-        elif "/stats" in request:
-            conn.sendall(f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{game_stats_json()}".encode())
-        else:
-            if '?' in request:
-                params = dict(pair.split('=') for pair in request.split('?')[1].split(' ')[0].split('&'))
-                if 'p1_name' in params and not players["P1"]["name"]:
-                    players["P1"]["name"] = params['p1_name'].replace('+', ' ')[:10]
-                    chat_history.append(f"{players['P1']['name']} joined!")
-                    update_oled(f"{players['P1']['name']} joined!")
-                if 'p2_name' in params and not players["P2"]["name"]:
-                    players["P2"]["name"] = params['p2_name'].replace('+', ' ')[:10]
-                    chat_history.append(f"{players['P2']['name']} joined!")
-                    update_oled(f"{players['P2']['name']} joined!")
-                if 'start' in params and params['start'] == '1' and players["P1"]["name"] and players["P2"]["name"] and not game_started:
-                    game_started = True
-                    chat_history.append("Game Started!")
-                    update_oled("Game Started!")
-                if 'roll' in params and params['roll'] == '1' and game_started and not game_over:
-                    if len(players[current_player]["rolls"]) < 6:
-                        dice_result = roll_dice()
-                        players[current_player]["rolls"].append(dice_result)
-                        players[current_player]["score"] += dice_result
-                        chat_history.append(f"{players[current_player]['name']}: {dice_result}")
-                        update_oled(f"{players[current_player]['name']}: {dice_result}")
-                        switch_player()
-                    if len(players["P1"]["rolls"]) == 6 and len(players["P2"]["rolls"]) == 6:
-                        game_over = True
-                        winner = determine_winner()
-                        chat_history.append(winner)
-                        update_oled(winner)
-                if 'chat_msg' in params and game_started and not game_over:
-                    chat_msg = params['chat_msg'].replace('+', ' ')[:20]
-                    chat_history.append(f"{players[current_player]['name']}: {chat_msg}")
-                    update_oled(f"{players[current_player]['name']}: {chat_msg}")
-                if 'restart' in params and params['restart'] == '1' and game_over:
-                    reset_game()
-                    update_oled("Game Restarted!")
-                if 'exit' in params and params['exit'] == '1' and game_over:
-                    reset_game(full_reset=True)
-                    update_oled("Game Exited!")
-            conn.sendall(f"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n{webpage()}".encode())
-        conn.close()
+# Splits /room/<id>/<sub> into (room_id, sub); anything else belongs to the main room
+def split_room_path(path):
+    if path.startswith("/room/"):
+        parts = path[6:].split("/", 1)
+        return parts[0], ("/" + parts[1]) if len(parts) > 1 else None
+    return DEFAULT_ROOM, path
+
+def handle_request(req):
+    print("Request Received:", req.method, req.path, req.query)
+
+    path = req.path
+    if path.endswith("favicon.ico"):
+        return "404 Not Found", "text/plain", ""
+    if path == "/metrics":
+        return metrics.reply()
+    if path == "/leaderboard":
+        try:
+            n = int(req.query.get('n', TOP_DEFAULT))
+        except ValueError:
+            n = -1
+        if n < 0:
+            return "400 Bad Request", "text/plain", "n must be a non-negative integer"
+        n = min(n, 100)
+        return "200 OK", "application/json", json.dumps(matches.summary(n)), {"Cache-Control": "no-cache"}
+    if path == "/rooms":
+        return "200 OK", "application/json", json.dumps(rooms.summary())
+
+    room_id, sub = split_room_path(path)
+    if sub is None:
+        # Relative links in the page need the trailing slash
+        return "301 Moved Permanently", "text/plain", "", {"Location": path + "/"}
+    room = rooms.get(room_id)
+    if room is None:
+        if not valid_room_id(room_id):
+            return "404 Not Found", "text/plain", "Invalid room id"
+        if sub == "/" and not req.query:
+            return page.reply(req)  # the page needs no room until someone acts in it
+        # Only an action opens a room, and opening one is charged like an action
+        acting = (sub == "/" or (sub.startswith("/api/") and sub[5:] in API_ACTIONS
+                                 and req.method == "POST"))
+        if not acting:
+            return "404 Not Found", "text/plain", "No such room"
+        if not limiter.allow(req.client):
+            return limiter.reply(req.client)
+        room = rooms.get(room_id, create=True)
+        if room is None:
+            return "503 Service Unavailable", "text/plain", "All rooms are in use"
+    room.touch()
+
+    if sub == "/events":
+        return room.events.subscribe(room.state.json())
+    if sub == "/stats":
+        return stats_response(room, req)
+    if sub == "/chat":
+        params = req.query
+        try:
+            after = int(params.get('after', 0))
+            limit = int(params.get('limit', FETCH_LIMIT))
+        except ValueError:
+            return "400 Bad Request", "text/plain", "after and limit must be integers"
+        return "200 OK", "application/json", json.dumps(room.chat_since(after, limit))
+    if sub.startswith("/api/"):
+        action = sub[5:]
+        if action not in API_ACTIONS:
+            return api_error("404 Not Found", "unknown action")
+        return api_response(room, req, action)
+    if sub != "/":
+        return "404 Not Found", "text/plain", ""
+
+    if req.query:
+        # Form submit: apply, then send the browser back to the cached page
+        if not limiter.allow(req.client):
+            return limiter.reply(req.client)
+        room.apply(req.query)
+        return "303 See Other", "text/plain", "", {"Location": path}
+    return page.reply(req)
+
+# Server Loop
+def main():
+    boot.mark("hardware")
+    wifi.start_ap()
+    if USE_THREAD:
+        worker.start()
+    if USE_THREAD:
+        background = (wifi.run(), rooms.run(), worker.run_outbox())
+    else:
+        background = (wifi.run(), rooms.run(), display.run())
+    asyncio.run(serve_async(handle_request, HTTP_HOST, HTTP_PORT, background=background,
+                            metrics=metrics, ready=lambda: boot.mark("listen")))
 
-    except Exception as e:
-        print("Error:", e)
-        conn.close()
\ No newline at end of file
+# Importing this module (tests, benchmarks) sets everything up without serving
+if __name__ == "__main__":
+    main()
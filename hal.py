@@ -0,0 +1,29 @@
+# === Hardware / network backends ===
+# The apps import network, machine, neopixel, dht and ssd1306 from here.
+# On the ESP32 these are the real MicroPython modules; under CPython (or with
+# ESP32_SIM=1) they are the simulators in sim_hw, and the server listens on
+# an unprivileged port so both apps can run on localhost.
+import sys
+
+SIMULATED = sys.implementation.name != "micropython"
+HTTP_HOST = "0.0.0.0"  # station and access point clients alike
+HTTP_PORT = 80
+
+try:
+    import os
+    if os.getenv("ESP32_SIM") == "1":
+        SIMULATED = True
+    if SIMULATED:
+        HTTP_HOST = os.getenv("ESP32_HOST", "127.0.0.1")
+        HTTP_PORT = int(os.getenv("ESP32_PORT", "8080"))
+except (ImportError, AttributeError):
+    pass
+
+if SIMULATED:
+    from sim_hw import network, machine, neopixel, dht, ssd1306
+else:
+    import network
+    import machine
+    import neopixel
+    import dht
+    import ssd1306
@@ -0,0 +1,215 @@
+# === Incremental HTTP request parser ===
+# A RequestReader belongs to one connection and reads into a fixed,
+# reusable buffer until the blank line that ends the headers. Only the head
+# is decoded, only the headers the apps use are kept, and anything larger
+# than the buffer is rejected before it is read.
+import json
+from compat import ticks_ms, ticks_us, ticks_diff
+
+MAX_HEAD = 1536   # request line + headers
+MAX_BODY = 512    # request bodies (forms, JSON actions)
+
+# Headers the apps look at; everything else is skipped while parsing
+KEPT_HEADERS = ("host", "content-length", "content-type", "if-none-match",
+                "accept-encoding", "connection", "idempotency-key")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message or status)
+        self.status = status
+
+
+# Percent-decoding for query strings and form bodies ("+" is a space)
+def unquote(s):
+    if "+" in s:
+        s = s.replace("+", " ")
+    if "%" not in s:
+        return s
+    parts = s.split("%")
+    out = bytearray(parts[0].encode())
+    for part in parts[1:]:
+        try:
+            if len(part) < 2:
+                raise ValueError
+            out.append(int(part[:2], 16))
+            out.extend(part[2:].encode())
+        except ValueError:
+            out.extend(b"%" + part.encode())
+    try:
+        return out.decode()
+    except UnicodeError:
+        return s
+
+
+def parse_query(qs):
+    params = {}
+    if qs:
+        for pair in qs.split("&"):
+            if pair:
+                key, _, value = pair.partition("=")
+                params[unquote(key)] = unquote(value)
+    return params
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "version", "headers", "body", "client")
+
+    def __init__(self, method, path, query, version, headers, body=b""):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.query = query      # dict of decoded query parameters
+        self.headers = headers  # lower-case names, KEPT_HEADERS only
+        self.body = body
+        self.client = None      # peer IP, set by the server loop
+
+    def header(self, name, default=None):
+        return self.headers.get(name, default)
+
+    # HTTP/1.1 connections persist unless the client says otherwise
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def form(self):
+        return parse_query(self.body.decode())
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+def parse_head(head):
+    lines = head.split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HTTPError("400 Bad Request", "malformed request line")
+    path, _, qs = target.partition("?")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            name = name.strip().lower()
+            if name in KEPT_HEADERS:
+                headers[name] = value.strip()
+    return Request(method, unquote(path), parse_query(qs), version, headers)
+
+
+class RequestReader:
+    def __init__(self, size=MAX_HEAD + MAX_BODY):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.end = 0      # bytes held in buf
+        self.scanned = 0  # bytes already searched for the header terminator
+        self.started = 0  # ticks_us() when the current request's first bytes arrived
+
+    # Forgets everything buffered, for reuse on a new connection
+    def reset(self):
+        self.end = 0
+        self.scanned = 0
+
+    # Offset just past "\r\n\r\n", or -1 while the head is incomplete
+    def _head_end(self):
+        start = max(self.scanned - 3, 0)
+        pos = bytes(self.mv[start:self.end]).find(b"\r\n\r\n")
+        self.scanned = self.end
+        return -1 if pos < 0 else start + pos + 4
+
+    def _space(self, limit):
+        if self.end >= limit:
+            raise HTTPError("431 Request Header Fields Too Large")
+        return self.mv[self.end:limit]
+
+    def _consume(self, n):
+        rest = self.end - n
+        if rest > 0:
+            self.buf[0:rest] = self.buf[n:self.end]
+            self.started = ticks_us()  # a pipelined request is already here
+        self.end = rest
+        self.scanned = 0
+
+    def _parse(self, head_end):
+        if head_end > MAX_HEAD:
+            raise HTTPError("431 Request Header Fields Too Large")
+        try:
+            head = bytes(self.mv[:head_end - 4]).decode()
+        except UnicodeError:
+            raise HTTPError("400 Bad Request", "undecodable request head")
+        req = parse_head(head)
+        # Digits only: a sign or junk would desync where the next request starts
+        length = req.headers.get("content-length") or "0"
+        if not length.isdigit():
+            raise HTTPError("400 Bad Request", "bad content-length")
+        length = int(length)
+        if length > MAX_BODY:
+            raise HTTPError("413 Payload Too Large")
+        return req, length
+
+    def _take_body(self, req, head_end, length):
+        req.body = bytes(self.mv[head_end:head_end + length])
+        self._consume(head_end + length)
+        return req
+
+    # === asyncio streams ===
+    async def _fill(self, stream, limit=MAX_HEAD):
+        space = self._space(limit)
+        if hasattr(stream, "readinto"):
+            n = await stream.readinto(space)
+        else:
+            data = await stream.read(len(space))
+            n = len(data)
+            space[:n] = data
+        if n and not self.end:
+            self.started = ticks_us()
+        self.end += n or 0
+        return n
+
+    # Next request from the stream, or None if the client closed first
+    async def read(self, stream):
+        head_end = self._head_end() if self.end else -1
+        while head_end < 0:
+            if not await self._fill(stream):
+                if self.end:
+                    raise HTTPError("400 Bad Request", "incomplete request")
+                return None
+            head_end = self._head_end()
+        req, length = self._parse(head_end)
+        while self.end < head_end + length:
+            if not await self._fill(stream, len(self.buf)):
+                raise HTTPError("400 Bad Request", "incomplete body")
+        return self._take_body(req, head_end, length)
+
+    # === Blocking sockets ===
+    def _fill_blocking(self, sock, limit=MAX_HEAD):
+        space = self._space(limit)
+        recv_into = getattr(sock, "recv_into", None) or sock.readinto
+        n = recv_into(space)
+        if n and not self.end:
+            self.started = ticks_us()
+        self.end += n or 0
+        return n
+
+    # `deadline_ms` bounds the whole request, not just each recv (slow senders)
+    def read_blocking(self, sock, deadline_ms=None):
+        start = ticks_ms()
+        head_end = self._head_end() if self.end else -1
+        while head_end < 0:
+            if not self._fill_blocking(sock):
+                if self.end:
+                    raise HTTPError("400 Bad Request", "incomplete request")
+                return None
+            self._check_deadline(start, deadline_ms)
+            head_end = self._head_end()
+        req, length = self._parse(head_end)
+        while self.end < head_end + length:
+            if not self._fill_blocking(sock, len(self.buf)):
+                raise HTTPError("400 Bad Request", "incomplete body")
+            self._check_deadline(start, deadline_ms)
+        return self._take_body(req, head_end, length)
+
+    def _check_deadline(self, start, deadline_ms):
+        if deadline_ms is not None and ticks_diff(ticks_ms(), start) > deadline_ms:
+            raise HTTPError("408 Request Timeout")
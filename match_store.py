@@ -0,0 +1,167 @@
+# === Dice Duel match log and leaderboard ===
+# Every finished match is appended to a JSON-lines log on flash. The
+# leaderboard (wins, games and total score per player) is rebuilt from the
+# log once at boot and then updated per match, and players are kept in rank
+# order so a top-N query only slices the list. When the log grows past
+# MAX_LOG_BYTES it is compacted: older matches are folded into one totals
+# line and only the most recent KEEP_MATCHES stay in full.
+import os
+import json
+import clock
+
+LOG_FILE = "matches.log"
+MAX_LOG_BYTES = 64 * 1024
+KEEP_MATCHES = 100
+RECENT = 10        # matches kept in RAM for /leaderboard
+TOP_DEFAULT = 10
+
+
+class MatchStore:
+    def __init__(self, path=LOG_FILE, max_bytes=MAX_LOG_BYTES, keep=KEEP_MATCHES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.players = {}   # name -> [wins, games, score_sum]
+        self.ranking = []   # names, best first
+        self.recent = []    # last RECENT match records, oldest first
+        self.matches = 0
+        self.size = 0
+        self.compactions = 0
+        self._load()
+
+    # === Index ===
+    def _key(self, name):
+        wins, games, total = self.players[name]
+        return (-wins, -total / games if games else 0, name)
+
+    def _place(self, name):
+        # Binary search for the name's rank; only the two players of a match move
+        key = self._key(name)
+        lo, hi = 0, len(self.ranking)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(self.ranking[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.ranking.insert(lo, name)
+
+    def _count(self, name, won, score, games=1):
+        stats = self.players.get(name)
+        if stats is None:
+            stats = self.players[name] = [0, 0, 0]
+        else:
+            self.ranking.remove(name)
+        stats[0] += won
+        stats[1] += games
+        stats[2] += score
+        self._place(name)
+
+    def _index(self, record):
+        if "totals" in record:
+            for name, (wins, games, total) in record["totals"].items():
+                self._count(name, wins, total, games)
+            self.matches += record.get("matches", 0)
+            return
+        winner = record["w"]
+        for slot in (0, 1):
+            self._count(record["p"][slot], 1 if winner == slot else 0, record["s"][slot])
+        self.matches += 1
+        self.recent.append(record)
+        if len(self.recent) > RECENT:
+            self.recent.pop(0)
+
+    def _load(self):
+        try:
+            f = open(self.path)
+        except OSError:
+            return
+        with f:
+            for line in f:
+                self.size += len(line)
+                try:
+                    self._index(json.loads(line))
+                except (ValueError, KeyError, TypeError, IndexError):
+                    pass  # torn last line after a power cut
+        print("Match log:", self.matches, "matches,", len(self.players), "players")
+
+    # === Log ===
+    def record(self, names, rolls, scores, room_id=""):
+        s1, s2 = scores
+        # "t" is Unix time, or null if the match ended before the clock was set
+        record = {"t": clock.now() if clock.valid() else None, "room": room_id, "p": list(names),
+                  "r": ["".join(str(v) for v in r) for r in rolls], "s": [s1, s2],
+                  "w": 0 if s1 > s2 else 1 if s2 > s1 else -1}
+        self._index(record)
+        line = json.dumps(record) + "\n"
+        try:
+            with open(self.path, "a") as f:
+                f.write(line)
+            self.size += len(line)
+        except OSError as e:
+            print("Match log write failed:", e)
+        if self.size > self.max_bytes:
+            self.compact()
+        return record
+
+    # Sink for Room(on_result=...)
+    def room_finished(self, room):
+        self.record(room.names, room.rolls, room.scores, room.id)
+
+    # Rewrites the log as one totals line plus the last `keep` matches
+    def compact(self):
+        tail = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    tail.append(line)
+                    if len(tail) > self.keep:
+                        tail.pop(0)
+        except OSError:
+            return
+        # Totals cover everything except the matches kept in full
+        totals = {name: list(stats) for name, stats in self.players.items()}
+        kept = []
+        for line in tail:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "totals" in record:
+                continue
+            kept.append(line)
+            for slot in (0, 1):
+                stats = totals[record["p"][slot]]
+                stats[0] -= 1 if record["w"] == slot else 0
+                stats[1] -= 1
+                stats[2] -= record["s"][slot]
+        totals = {name: stats for name, stats in totals.items() if stats[1]}
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                head = json.dumps({"totals": totals, "matches": self.matches - len(kept)}) + "\n"
+                f.write(head)
+                size = len(head)
+                for line in kept:
+                    f.write(line)
+                    size += len(line)
+            os.rename(tmp, self.path)
+        except OSError as e:
+            print("Match log compaction failed:", e)
+            return
+        self.size = size
+        self.compactions += 1
+        print("Match log compacted to", size, "bytes")
+
+    # === Queries ===
+    def top(self, n=TOP_DEFAULT):
+        board = []
+        for name in self.ranking[:n]:
+            wins, games, total = self.players[name]
+            board.append({"name": name, "wins": wins, "games": games,
+                          "avg_score": round(total / games, 1) if games else 0})
+        return board
+
+    def summary(self, n=TOP_DEFAULT):
+        return {"players": len(self.players), "matches": self.matches,
+                "top": self.top(n), "recent": self.recent[::-1]}
@@ -0,0 +1,122 @@
+# === Request metrics in Prometheus text format ===
+# Cheap enough to leave on: recording is a ticks_us() call, a dict lookup and
+# a short bucket scan, with no allocation once a route has been seen.
+# Durations are kept in microseconds and exported in milliseconds.
+import gc
+from compat import ticks_us, ticks_diff
+
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+MAX_ROUTES = 16  # further routes are counted as "other"
+OTHER = "other"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum_us")
+
+    def __init__(self, bounds_ms=BUCKETS_MS):
+        self.bounds = [b * 1000 for b in bounds_ms]
+        self.counts = [0] * len(bounds_ms)  # per bucket, not cumulative
+        self.count = 0
+        self.sum_us = 0
+
+    def observe(self, us):
+        self.count += 1
+        self.sum_us += us
+        for i, bound in enumerate(self.bounds):
+            if us <= bound:
+                self.counts[i] += 1
+                return
+
+    def lines(self, name, labels):
+        total = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            total += n
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}\n'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}\n'
+        yield f'{name}_sum{{{labels}}} {self.sum_us / 1000:.3f}\n'
+        yield f'{name}_count{{{labels}}} {self.count}\n'
+
+
+class Metrics:
+    def __init__(self, route_of=None, max_routes=MAX_ROUTES):
+        self.route_of = route_of  # req -> route label; defaults to req.path
+        self.max_routes = max_routes
+        self.routes = {}      # route -> Histogram of request latency
+        self.responses = {}   # (route, status code) -> count
+        self.phases = {}      # phase -> Histogram
+        self.values = []      # (name, type, help, fn, label) read when scraped
+
+    def route(self, req, status):
+        if req is None or status.startswith("404"):
+            return OTHER
+        route = self.route_of(req) if self.route_of else req.path
+        if route not in self.routes and len(self.routes) >= self.max_routes:
+            return OTHER
+        return route
+
+    # Time since `started` (a ticks_us() value) goes to the phase; returns now
+    def phase(self, name, started):
+        now = ticks_us()
+        self.observe(name, ticks_diff(now, started))
+        return now
+
+    def observe(self, name, us):
+        hist = self.phases.get(name)
+        if hist is None:
+            hist = self.phases[name] = Histogram()
+        hist.observe(us)
+
+    # One finished request; `started` is None for long-lived streams
+    def request(self, req, status, started=None):
+        route = self.route(req, status)
+        key = (route, status[:3])
+        self.responses[key] = self.responses.get(key, 0) + 1
+        if started is not None:
+            hist = self.routes.get(route)
+            if hist is None:
+                hist = self.routes[route] = Histogram()
+            hist.observe(ticks_diff(ticks_us(), started))
+
+    # Exports fn() under `name` at scrape time (counters kept elsewhere, gauges);
+    # a dict result becomes one series per key, labelled `label`
+    def value(self, name, fn, help="", type="gauge", label="key"):
+        self.values.append((name, type, help, fn, label))
+
+    def lines(self):
+        yield "# HELP http_requests_total Responses sent, by route and status.\n"
+        yield "# TYPE http_requests_total counter\n"
+        for (route, code), n in sorted(self.responses.items()):
+            yield f'http_requests_total{{route="{route}",code="{code}"}} {n}\n'
+        yield "# HELP http_request_duration_ms Time from first request byte to last response byte.\n"
+        yield "# TYPE http_request_duration_ms histogram\n"
+        for route in sorted(self.routes):
+            yield from self.routes[route].lines("http_request_duration_ms", f'route="{route}"')
+        yield "# HELP phase_duration_ms Time spent per processing phase.\n"
+        yield "# TYPE phase_duration_ms histogram\n"
+        for name in sorted(self.phases):
+            yield from self.phases[name].lines("phase_duration_ms", f'phase="{name}"')
+        yield from self._system()
+        for name, type, help, fn, label in self.values:
+            try:
+                v = fn()
+            except Exception:
+                continue
+            if v is None:
+                continue
+            yield f"# HELP {name} {help}\n# TYPE {name} {type}\n"
+            if isinstance(v, dict):
+                for key, n in v.items():
+                    yield f'{name}{{{label}="{key}"}} {n}\n'
+            else:
+                yield f"{name} {v}\n"
+
+    def _system(self):
+        if hasattr(gc, "mem_free"):
+            yield f"# TYPE heap_free_bytes gauge\nheap_free_bytes {gc.mem_free()}\n"
+            yield f"# TYPE heap_alloc_bytes gauge\nheap_alloc_bytes {gc.mem_alloc()}\n"
+        if hasattr(gc, "get_stats"):
+            collections = sum(s["collections"] for s in gc.get_stats())
+            yield f"# TYPE gc_collections_total counter\ngc_collections_total {collections}\n"
+
+    def reply(self):
+        return "200 OK", "text/plain; version=0.0.4", self.lines(), {"Cache-Control": "no-store"}
@@ -0,0 +1,144 @@
+# === Peripheral worker thread ===
+# Optional split between networking and hardware: one thread owns the sensor,
+# the OLED and the NeoPixel and runs their periodic jobs, while the network
+# side only parses requests and answers them. The two sides meet in three
+# places: a lock-protected command queue (network -> hardware), a snapshot
+# dict the worker replaces after every loop (hardware -> network), and an
+# outbox of calls the worker hands back to the network side, which runs them
+# in drain(). Replacing the whole snapshot is a single reference swap, so
+# readers never see it half written and never take the lock. Anything that
+# requests also read (history rings, the sample log, metrics) is only ever
+# updated through the outbox, i.e. on the network thread.
+import time
+from compat import ticks_us, ticks_diff, sleep_ms
+
+try:
+    import threading
+
+    def _allocate_lock():
+        return threading.Lock()
+
+    def _start_thread(fn):
+        threading.Thread(target=fn, daemon=True).start()  # exits with the process
+except ImportError:
+    import _thread  # MicroPython
+
+    def _allocate_lock():
+        return _thread.allocate_lock()
+
+    def _start_thread(fn):
+        _thread.start_new_thread(fn, ())
+
+LOOP_MS = 20        # worker period; matches the LED effect frame rate
+MAX_QUEUE = 32      # commands beyond this are dropped (oldest first); same for the outbox
+DRAIN_MS = 100      # asyncio mode: how often the network side runs the outbox
+
+
+class PeripheralWorker:
+    def __init__(self, loop_ms=LOOP_MS, max_queue=MAX_QUEUE):
+        self.loop_ms = loop_ms
+        self.max_queue = max_queue
+        self.lock = _allocate_lock()
+        self.queue = []
+        self.outbox = []
+        self.jobs = []        # fn() called every loop, e.g. sampler.poll
+        self.publishers = []  # fn() -> dict merged into the snapshot
+        self.snapshot = {}
+        self.running = False
+        self.loops = 0
+        self.commands = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def every_loop(self, fn):
+        self.jobs.append(fn)
+
+    def publish(self, fn):
+        self.publishers.append(fn)
+
+    # Called from the network side; returns at once
+    def submit(self, fn, *args):
+        with self.lock:
+            if len(self.queue) >= self.max_queue:
+                self.queue.pop(0)
+                self.dropped += 1
+            self.queue.append((fn, args))
+
+    # Called from the worker; fn(*args) runs on the network side in drain().
+    # Before the thread starts there is only one side, so it runs at once.
+    def deliver(self, fn, *args):
+        if not self.running:
+            fn(*args)
+            return
+        with self.lock:
+            if len(self.outbox) >= self.max_queue:
+                self.outbox.pop(0)
+                self.dropped += 1
+            self.outbox.append((fn, args))
+
+    # Wraps a listener so the worker's calls to it are delivered instead
+    def on_network(self, fn):
+        return lambda *args: self.deliver(fn, *args)
+
+    # Network side: runs what the worker handed over
+    def drain(self):
+        with self.lock:
+            calls = self.outbox
+            self.outbox = []
+        for fn, args in calls:
+            self._run(fn, args)
+
+    async def run_outbox(self):
+        while True:
+            self.drain()
+            await sleep_ms(DRAIN_MS)
+
+    def _run(self, fn, args=()):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.errors += 1
+            print("Peripheral error:", e)
+
+    def step(self):
+        with self.lock:
+            commands = self.queue
+            self.queue = []
+        for fn, args in commands:
+            self._run(fn, args)
+        self.commands += len(commands)
+        for fn in self.jobs:
+            self._run(fn)
+        snapshot = {}
+        for fn in self.publishers:
+            snapshot.update(fn())
+        self.snapshot = snapshot
+        self.loops += 1
+
+    def _loop(self):
+        while self.running:
+            self.step()
+            time.sleep(self.loop_ms / 1000)
+
+    def start(self):
+        self.step()  # the first snapshot is ready before any request arrives
+        self.running = True
+        _start_thread(self._loop)
+        print("Peripheral worker started")
+
+    def status(self):
+        return {"loops": self.loops, "commands": self.commands, "dropped": self.dropped,
+                "errors": self.errors, "queued": len(self.queue), "outbox": len(self.outbox)}
+
+
+# Stands in for metrics.Metrics in drivers the worker runs: the duration is
+# measured on the worker, the histogram is updated on the network side
+class MetricsRelay:
+    def __init__(self, worker, metrics):
+        self.worker = worker
+        self.metrics = metrics
+
+    def phase(self, name, started):
+        now = ticks_us()
+        self.worker.deliver(self.metrics.observe, name, ticks_diff(now, started))
+        return now
@@ -0,0 +1,91 @@
+# === State-diffing NeoPixel driver ===
+# Keeps the color the LED is showing and only calls np.write() when it really
+# changes. Fades and effects are stepped by a background task, so a request
+# just records the target and returns.
+from compat import ticks_ms, ticks_diff, sleep_ms
+
+STEP_MS = 20       # effect frame period (50 fps)
+IDLE_MS = 100      # poll period while no effect is running
+EFFECTS = ("fade", "blink", "pulse")
+
+
+def _clamp(v):
+    return 0 if v < 0 else 255 if v > 255 else int(v)
+
+
+def _mix(a, b, t):
+    return tuple(_clamp(a[i] + (b[i] - a[i]) * t) for i in range(3))
+
+
+class PixelLed:
+    def __init__(self, np, index=0):
+        self.np = np
+        self.index = index
+        self.color = tuple(np[index])  # what the LED shows right now
+        self.target = self.color
+        self.writes = 0
+        self.skipped = 0
+        self._effect = None
+        self._start = self.color
+        self._started = 0
+        self._duration = 0
+
+    def _write(self, color):
+        if color == self.color:
+            self.skipped += 1
+            return False
+        self.np[self.index] = color
+        self.np.write()
+        self.color = color
+        self.writes += 1
+        return True
+
+    # Immediate change; only channels that are not None are applied
+    def set(self, r=None, g=None, b=None):
+        self.target = self._merge(r, g, b)
+        self._effect = None
+        return self._write(self.target)
+
+    # Starts a timed effect towards / around the target color
+    def play(self, effect, r=None, g=None, b=None, duration_ms=1000):
+        if effect not in EFFECTS:
+            raise ValueError("unknown effect: " + str(effect))
+        self.target = self._merge(r, g, b)
+        self._effect = effect
+        self._start = self.color
+        self._started = ticks_ms()
+        self._duration = max(duration_ms, STEP_MS)
+
+    def _merge(self, r, g, b):
+        old = self.target
+        return (old[0] if r is None else _clamp(r),
+                old[1] if g is None else _clamp(g),
+                old[2] if b is None else _clamp(b))
+
+    # Advances the running effect by one frame
+    def step(self):
+        if self._effect is None:
+            return
+        elapsed = ticks_diff(ticks_ms(), self._started)
+        t = elapsed / self._duration
+        if self._effect == "fade":
+            if t >= 1:
+                self._effect = None
+                self._write(self.target)
+            else:
+                self._write(_mix(self._start, self.target, t))
+        elif self._effect == "blink":
+            self._write(self.target if int(t * 2) % 2 == 0 else (0, 0, 0))
+        elif self._effect == "pulse":
+            phase = t % 1
+            level = phase * 2 if phase < 0.5 else 2 - phase * 2
+            self._write(_mix((0, 0, 0), self.target, level))
+
+    async def run(self):
+        while True:
+            self.step()
+            await sleep_ms(STEP_MS if self._effect else IDLE_MS)
+
+    def status(self):
+        return {"color": list(self.color), "target": list(self.target),
+                "effect": self._effect, "writes": self.writes, "skipped": self.skipped}
@@ -0,0 +1,55 @@
+# === Per-client token buckets ===
+# Each client IP gets `burst` tokens that refill at `rate` per second; a
+# request that finds the bucket empty is refused with 429. Only mutating
+# actions (rolls, chat, messages, colors) are charged, so polling is never
+# throttled here. At most `max_clients` buckets are kept; when the table is
+# full the bucket idle the longest is dropped (a fresh bucket is full anyway).
+from compat import ticks_ms, ticks_diff
+
+RATE = 2          # tokens per second
+BURST = 6
+MAX_CLIENTS = 32
+
+
+class RateLimiter:
+    def __init__(self, rate=RATE, burst=BURST, max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = {}  # ip -> [tokens, ticks_ms of the last update]
+        self.limited = 0
+
+    def allow(self, client, cost=1):
+        now = ticks_ms()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                self._drop_oldest()
+            bucket = self.buckets[client] = [self.burst, now]
+        else:
+            tokens = bucket[0] + ticks_diff(now, bucket[1]) * self.rate / 1000
+            bucket[0] = tokens if tokens < self.burst else self.burst
+            bucket[1] = now
+        if bucket[0] < cost:
+            self.limited += 1
+            return False
+        bucket[0] -= cost
+        return True
+
+    # Seconds until `cost` tokens are available again, for Retry-After
+    def retry_after(self, client, cost=1):
+        bucket = self.buckets.get(client)
+        if bucket is None or bucket[0] >= cost:
+            return 0
+        return int((cost - bucket[0]) / self.rate) + 1
+
+    def _drop_oldest(self):
+        oldest = None
+        for client, bucket in self.buckets.items():
+            if oldest is None or ticks_diff(bucket[1], self.buckets[oldest][1]) < 0:
+                oldest = client
+        del self.buckets[oldest]
+
+    # Reply for a refused request
+    def reply(self, client):
+        return "429 Too Many Requests", "text/plain", "Slow down", {"Retry-After": self.retry_after(client)}
@@ -1,90 +1,141 @@
-import network
-import socket
-import machine
-import neopixel
-import dht
-import ssd1306
-import time
+import json
+from compat import asyncio
+from dht_sampler import DHTSampler
+from sensor_history import SensorHistory
+from sample_log import SampleLog
+from webserver import serve_async, serve_blocking, connections
+from rate_limit import RateLimiter
+from static_asset import StaticAsset
+from display import TextDisplay
+from pixel_led import PixelLed
+from template import Template
+from weather import WeatherRules, ComfortMetrics
+from wifi import BootTimer, WifiLink
+from metrics import Metrics
+from peripherals import PeripheralWorker, MetricsRelay
+from hal import network, machine, neopixel, dht, ssd1306, HTTP_HOST, HTTP_PORT
 
 # === WiFi Configuration ===
 SSID = "TampleDiago"
 PASSWORD = "12345688"
 
-sta = network.WLAN(network.STA_IF)
-sta.active(True)
-sta.connect(SSID, PASSWORD)
-
-while not sta.isconnected():
-    time.sleep(1)
-print("Connected! Station IP:", sta.ifconfig()[0])
-
 ssid_ap = "Muneeb1368"
 password_ap = "12345678"
 auth_mode = network.AUTH_WPA2_PSK
 
+boot = BootTimer()
+sta = network.WLAN(network.STA_IF)
 ap = network.WLAN(network.AP_IF)
-ap.active(True)
-ap.config(essid=ssid_ap, password=password_ap, authmode=auth_mode)
-print("Access Point Active")
-print("AP IP Address:", ap.ifconfig()[0])
+
+# AP first, station in the background; see wifi.py
+wifi = WifiLink(sta, ap, SSID, PASSWORD, ssid_ap, password_ap, auth_mode, boot=boot)
+
+# === Metrics (served on /metrics) ===
+metrics = Metrics()
+
+# === Peripheral Worker (threaded mode) ===
+# With USE_THREAD the worker thread owns the sensor, the OLED and the LED:
+# handlers queue changes through peripheral() and read the snapshot it
+# publishes, so bus timing never lands on the request path. Sample listeners
+# and driver timings come back through worker.on_network / MetricsRelay, so
+# the history, the sample log and the metrics are only touched by the
+# network side, which also streams them.
+USE_THREAD = False
+worker = PeripheralWorker()
+worker_metrics = MetricsRelay(worker, metrics)
 
 # === NeoPixel Setup ===
 pin = 48
 pixel = 1
 np = neopixel.NeoPixel(machine.Pin(pin), pixel)
 
-def set_color(r, g, b):
-    np[0] = (r, g, b)
-    np.write()
-    print(f"Set Color to: R={r}, G={g}, B={b}")
+# Remembers the shown color; writes only on change, effects run in the background
+led = PixelLed(np)
+
+def set_color(r=None, g=None, b=None, effect=None, duration_ms=1000):
+    if effect:
+        led.play(effect, r, g, b, duration_ms)
+    elif not led.set(r, g, b):
+        return
+    print(f"Set Color to: R={led.target[0]}, G={led.target[1]}, B={led.target[2]}", effect or "")
 
 # === DHT11 Sensor Setup ===
-dht_pin = machine.Pin(4)
-sensor = dht.DHT11(dht_pin)
+SENSOR_INTERVAL_MS = 2000  # background sampling period
+sampler = DHTSampler(dht.DHT11(machine.Pin(4)), interval_ms=SENSOR_INTERVAL_MS, metrics=worker_metrics)
 
-def read_dht():
-    try:
-        sensor.measure()
-        temp = sensor.temperature()
-        hum = sensor.humidity()
-        return temp, hum
-    except Exception as e:
-        print("DHT Error:", e)
-        return "Error", "Error"
+# Raw samples plus per-minute and per-hour rollups, fed by the sampler
+history = SensorHistory()
+sampler.subscribe(worker.on_network(history.add))
+
+# Minute averages appended to flash in batched blocks; streamed by /history.csv
+sample_log = SampleLog()
+sampler.subscribe(worker.on_network(sample_log.add))
 
 # === OLED Display Setup ===
 i2c = machine.SoftI2C(scl=machine.Pin(9), sda=machine.Pin(8))
 oled = ssd1306.SSD1306_I2C(128, 64, i2c)
 
+# Handlers queue text; the display redraws changed lines on its own schedule
+display = TextDisplay(oled, line_y=(0, 20), metrics=worker_metrics)
+
 def update_oled(message):
-    oled.fill(0)
-    oled.text("Message:", 0, 0)
-    oled.text(message, 0, 20)
-    oled.show()
+    display.set_lines("Message:", message)
     print("OLED Updated:", message)
 
+# Jobs and snapshot of the peripheral worker (see above)
+worker.every_loop(sampler.poll)
+worker.every_loop(display.flush)
+worker.every_loop(led.step)
+worker.publish(lambda: {"sensor": sampler.status(), "color": led.color})
+
+def peripheral(fn, *args):
+    if worker.running:
+        worker.submit(fn, *args)
+    else:
+        fn(*args)
+
+def peripheral_state():
+    if worker.running:
+        return worker.snapshot
+    return {"sensor": sampler.status(), "color": led.color}
+
+metrics.value("sensor_reads_total", lambda: sampler.reads, "Good DHT readings.", "counter")
+metrics.value("sensor_retries_total", lambda: sampler.retry_count, "DHT reads retried.", "counter")
+metrics.value("sensor_errors_total", lambda: sampler.errors, "DHT reads failed after retries.", "counter")
+metrics.value("sensor_age_ms", sampler.age_ms, "Age of the cached reading.")
+metrics.value("oled_frames_total", lambda: display.frames, "OLED frames sent.", "counter")
+metrics.value("sample_log_bytes", lambda: sample_log.status()["bytes"], "Sample log size on flash.")
+metrics.value("sample_log_write_errors_total", lambda: sample_log.write_errors,
+              "Failed sample log writes.", "counter")
+metrics.value("led_writes_total", lambda: led.writes, "NeoPixel writes.", "counter")
+metrics.value("peripheral_commands_total", lambda: worker.commands, "Commands run by the peripheral thread.",
+              "counter")
+metrics.value("peripheral_dropped_total", lambda: worker.dropped, "Commands dropped from a full queue.",
+              "counter")
+metrics.value("http_connections_active", lambda: connections["active"], "Open client connections.")
+metrics.value("http_connections_rejected_total", lambda: connections["rejected"],
+              "Connections refused with 503 at the connection cap.", "counter")
+metrics.value("http_timeouts_total", lambda: connections["timeouts"], "Clients dropped for stalling.", "counter")
+metrics.value("rate_limited_total", lambda: limiter.limited, "Actions refused with 429.", "counter")
+metrics.value("boot_phase_ms", lambda: boot.phases, "Milliseconds from start to each boot phase.",
+              label="phase")
+metrics.value("wifi_connected", lambda: int(wifi.state == "connected"), "Station link up.")
+metrics.value("wifi_attempts_total", lambda: wifi.attempts, "Station connection attempts.", "counter")
+
 # === Weather Condition Logic ===
+# Rules are compiled into a lookup table once (weather_rules.json overrides them)
+weather_rules = WeatherRules.load()
+
 def get_weather_condition(temp, hum):
-    if temp == "Error" or hum == "Error":
-        return "Unknown"
-    temp = float(temp)
-    hum = float(hum)
-    
-    if 25 <= temp <= 30 and 40 <= hum <= 50:
-        return "Normal"
-    elif temp < 25 and hum < 40:
-        return "Dry or Cool"
-    elif 20 <= temp <= 30 and hum > 64:
-        return "Cool or Moist"
-    elif temp > 40 and hum < 50:
-        return "Hot or Dry"
-    else:
-        return "Other"
+    return weather_rules.classify(temp, hum)
+
+# Dew point, heat index, moving averages and trends, updated once per sample
+comfort = ComfortMetrics(weather_rules)
+sampler.subscribe(worker.on_network(comfort.add))
 
 # === Web Server Setup ===
-def webpage(temp, hum, message):
-    weather = get_weather_condition(temp, hum)
-    html = """<!DOCTYPE html>
+# Compiled once; responses stream its constant chunks around the slot values
+PAGE = Template("""<!DOCTYPE html>
 <html>
 <head>
     <title>ESP32 Control Panel</title>
@@ -157,6 +208,17 @@ def webpage(temp, hum, message):
             transition: background 0.3s ease;
             margin-bottom: 10px;
         }
+        .input-group select {
+            padding: 8px;
+            border: none;
+            border-radius: 5px;
+            background: rgba(255, 255, 255, 0.2);
+            color: #fff;
+            margin-bottom: 10px;
+        }
+        .input-group select option {
+            color: #000;
+        }
         .input-group input:focus {
             background: rgba(255, 255, 255, 0.3);
         }
@@ -194,97 +256,236 @@ def webpage(temp, hum, message):
             color: #fff;
             font-size: 1.2em;
         }
+        .nojs {
+            text-align: center;
+            color: #e0e0e0;
+        }
+        .nojs a {
+            color: #00f05c;
+        }
     </style>
 </head>
 <body>
     <h2>ESP32 RGB & Sensor Control</h2>
+    <noscript><p class="nojs">Live values need JavaScript. <a href="/lite">Open the server-rendered page</a></p></noscript>
     <div class="main-container">
         <div class="left-column">
             <div class="container">
                 <h3>Set NeoPixel Color</h3>
-                <form action="/" method="GET">
+                <form action="" method="GET">
                     <div class="input-group">
                         <label>Red:</label> <input type="number" name="r" min="0" max="255"><br>
                         <label>Green:</label> <input type="number" name="g" min="0" max="255"><br>
                         <label>Blue:</label> <input type="number" name="b" min="0" max="255"><br>
+                        <label>Effect:</label> <select name="fx">
+                            <option value="">None</option>
+                            <option value="fade">Fade</option>
+                            <option value="blink">Blink</option>
+                            <option value="pulse">Pulse</option>
+                        </select><br>
                     </div>
                     <button type="submit">Set Color</button>
                 </form>
             </div>
             <div class="container">
                 <h3>Update OLED Display</h3>
-                <form action="/" method="GET">
+                <form action="" method="GET">
                     <input type="text" name="msg" placeholder="Enter message" maxlength="20">
                     <button type="submit">Send to OLED</button>
                 </form>
-                <p>Last Message: <strong>""" + str(message) + """</strong></p>
+                <p>Last Message: <strong id="message">{{message|html}}</strong></p>
             </div>
         </div>
         <div class="right-column">
             <div class="container">
                 <h3>Temperature & Humidity</h3>
                 <div class="sensor-reading">
-                    <p>Temperature: <strong>""" + str(temp) + """C</strong></p>
-                    <p>Humidity: <strong>""" + str(hum) + """%</strong></p>
-                    <p>Weather: <strong>""" + str(weather) + """</strong></p>
+                    <p>Temperature: <strong><span id="temp">{{temp|html}}</span>C</strong></p>
+                    <p>Humidity: <strong><span id="hum">{{hum|html}}</span>%</strong></p>
+                    <p>Weather: <strong id="weather">{{weather|html}}</strong></p>
+                    <p>Dew Point: <strong><span id="dew">{{dew|html}}</span>C</strong></p>
+                    <p>Feels Like: <strong><span id="feels">{{feels|html}}</span>C</strong></p>
                 </div>
             </div>
         </div>
     </div>
+    <script>
+        function render(data) {
+            document.getElementById('temp').innerText = data.temp;
+            document.getElementById('hum').innerText = data.hum;
+            document.getElementById('weather').innerText = data.weather;
+            document.getElementById('dew').innerText = data.dew_point;
+            document.getElementById('feels').innerText = data.heat_index;
+            document.getElementById('message').innerText = data.message;
+        }
+        function refresh(query) {
+            fetch('/state' + (query ? '?' + query : ''))
+                .then(response => response.json())
+                .then(render);
+        }
+        // Forms go through /state so only the small JSON comes back
+        document.querySelectorAll('form').forEach(form => {
+            form.onsubmit = e => {
+                e.preventDefault();
+                refresh(new URLSearchParams(new FormData(form)).toString());
+                form.reset();
+            };
+        });
+        refresh();
+        setInterval(refresh, 5000);
+    </script>
 </body>
-</html>"""
-    return html
+</html>""")
 
-# Initialize socket
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.bind((sta.ifconfig()[0], 80))
-s.listen(5)
+# Dew point and heat index of the current reading, "--" while it is stale
+def comfort_values(temp):
+    values = comfort.values  # replaced whole by the sampler, never edited in place
+    if temp == "Error" or not values:
+        return "--", "--"
+    return values["dew_point"], values["heat_index"]
 
-oled_message = "Hello!"
+def webpage(temp, hum, message):
+    weather = get_weather_condition(temp, hum)
+    dew, feels = comfort_values(temp)
+    return PAGE.render(temp=temp, hum=hum, message=message, weather=weather, dew=dew, feels=feels)
 
-while True:
-    conn, addr = s.accept()
-    print('Got connection from', addr)
-    request = conn.recv(1024).decode()
-    print("Request Received:\n", request)
+# Static shell served from / ; live values come from /state
+page = StaticAsset(PAGE.render_bytes(temp="--", hum="--", message="", weather="--", dew="--", feels="--"),
+                   "text/html")
+
+STATE = Template('{"temp": {{temp|json}}, "hum": {{hum|json}}, "weather": {{weather|json}}, '
+                 '"dew_point": {{dew|json}}, "heat_index": {{feels|json}}, '
+                 '"message": {{message|json}}, "color": {{color|json}}, "age_ms": {{age_ms|json}}}')
+
+# === Request Handling ===
+oled_message = "Hello!"
+update_oled(oled_message)
 
-    if "favicon.ico" in request:
-        conn.close()
-        continue
+# Color, effect and message changes: a burst of 6, then 2 per second per client IP
+limiter = RateLimiter()
+ACTION_PATHS = ("/", "/state", "/lite")
 
-    # Default values
-    r, g, b = 0, 0, 0
-    message = oled_message
+# Empty or missing fields mean "leave unchanged"
+def int_param(params, key):
+    value = params.get(key, "")
+    return int(value) if value else None
 
-    # Parse GET request parameters
+def apply_params(params):
+    global oled_message
     try:
-        if '?' in request:
-            params = request.split('?')[1].split(' ')[0]
-            pairs = params.split('&')
-            for pair in pairs:
-                key, value = pair.split('=')
-                if key == 'r':
-                    r = int(value)
-                elif key == 'g':
-                    g = int(value)
-                elif key == 'b':
-                    b = int(value)
-                elif key == 'msg':
-                    message = value.replace('+', ' ')[:20]
+        r = int_param(params, 'r')
+        g = int_param(params, 'g')
+        b = int_param(params, 'b')
+        effect = params.get('fx') or None
+        duration_ms = int_param(params, 'ms') or 1000
+        if effect or r is not None or g is not None or b is not None:
+            peripheral(set_color, r, g, b, effect, duration_ms)
     except Exception as e:
         print("Error parsing request:", e)
 
-    print(f"Parsed Values - R: {r}, G: {g}, B: {b}, Message: {message}")
-    # Update hardware
-    set_color(r, g, b)
-    update_oled(message)
-    oled_message = message
+    if 'msg' in params:
+        oled_message = params['msg'][:20]
+        peripheral(update_oled, oled_message)
 
-    # read sensor data
-    temp, hum = read_dht()
+def state_json():
+    state = peripheral_state()
+    sensor = state["sensor"]
+    temp, hum = sensor["temp"], sensor["hum"]
+    dew, feels = comfort_values(temp)
+    return STATE.render(temp=temp, hum=hum, weather=get_weather_condition(temp, hum), dew=dew, feels=feels,
+                        message=oled_message, color=state["color"], age_ms=sensor["age_ms"])
+
+def handle_request(req):
+    print("Request Received:", req.method, req.path, req.query)
+
+    if req.path == "/favicon.ico":
+        return None
+
+    if req.path == "/metrics":
+        return metrics.reply()
+
+    if req.query and req.path in ACTION_PATHS and not limiter.allow(req.client):
+        return limiter.reply(req.client)
+
+    # Cached sensor reading as JSON; never touches the sensor bus
+    if req.path == "/sensor":
+        status = dict(peripheral_state()["sensor"])
+        status["weather"] = get_weather_condition(status["temp"], status["hum"])
+        status["derived"] = comfort.values
+        return "200 OK", "application/json", json.dumps(status)
+
+    # Sample history: /history?res=raw|minute|hour&limit=N
+    if req.path == "/history":
+        try:
+            params = req.query
+            res = params.get('res', 'minute')
+            limit = int(params['limit']) if 'limit' in params else None
+            history.series(res)  # validates res before the 200 goes out
+        except Exception as e:
+            return "400 Bad Request", "application/json", json.dumps({"error": str(e)})
+        return "200 OK", "application/json", history.iter_json(res, limit)
+
+    # Logged minute averages from flash: /history.csv?since=<Unix time, seconds since 1970 UTC>
+    if req.path == "/history.csv":
+        try:
+            since = int(req.query.get('since', 0))
+        except ValueError:
+            return "400 Bad Request", "text/plain", "since must be an integer"
+        return "200 OK", "text/csv", sample_log.iter_csv(since), {
+            "Content-Disposition": 'attachment; filename="history.csv"', "Cache-Control": "no-store"}
+
+    # Live values for the page; form fields in the query are applied first
+    if req.path == "/state":
+        if req.query:
+            apply_params(req.query)
+        return "200 OK", "application/json", state_json(), {"Cache-Control": "no-store"}
+
+    # Server-rendered page for browsers without JavaScript
+    if req.path == "/lite":
+        if req.query:
+            apply_params(req.query)
+        sensor = peripheral_state()["sensor"]
+        return "200 OK", "text/html", webpage(sensor["temp"], sensor["hum"], oled_message)
+
+    if req.path != "/":
+        return "404 Not Found", "text/plain", "Not Found"
+    if req.query:
+        # Plain form submit: apply, then send the browser back to the cached shell
+        apply_params(req.query)
+        return "303 See Other", "text/plain", "", {"Location": "/"}
+    return page.reply(req)
+
+# === Blocking Mode: Wi-Fi, sensor, OLED and LED work between connections ===
+# (and every half second while no client is connected)
+def between_requests():
+    wifi.poll()
+    if USE_THREAD:
+        worker.drain()  # the worker does the rest
+        return
+    sampler.poll()
+    display.flush()
+    led.step()
+
+# === Server Start ===
+USE_ASYNCIO = True  # False falls back to the original one-connection-at-a-time loop
+
+def main():
+    boot.mark("hardware")
+    wifi.start_ap()
+    if USE_THREAD:
+        worker.start()  # the network side below keeps only Wi-Fi upkeep
+    if USE_ASYNCIO:
+        if USE_THREAD:
+            background = (wifi.run(), worker.run_outbox())
+        else:
+            background = (wifi.run(), sampler.run(), display.run(), led.run())
+        asyncio.run(serve_async(handle_request, HTTP_HOST, HTTP_PORT, background=background,
+                                metrics=metrics, ready=lambda: boot.mark("listen")))
+    else:
+        between_requests()
+        serve_blocking(handle_request, HTTP_HOST, HTTP_PORT, idle=between_requests,
+                       metrics=metrics, ready=lambda: boot.mark("listen"))
 
-    # Send response
-    response = webpage(temp, hum, message)
-    conn.send('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n')
-    conn.send(response)
-    conn.close()
+# Importing this module (tests, benchmarks) sets everything up without serving
+if __name__ == "__main__":
+    main()
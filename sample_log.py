@@ -0,0 +1,172 @@
+# === Append-only sensor log on flash ===
+# Samples are averaged over LOG_INTERVAL seconds and packed into 8-byte
+# records (uint32 time, int16 temperature and uint16 humidity in tenths).
+# Records collect in a RAM block and reach flash one whole block at a time,
+# which keeps write amplification and the time spent in file writes low.
+# Files are append-only segments that rotate at SEGMENT_BYTES; the oldest
+# segment is deleted once MAX_SEGMENTS exist, which caps the flash used.
+# A torn record at the end of a segment (power loss) is ignored on read.
+# Record times are Unix time (clock.py). Samples that arrive before the clock
+# is set are held in RAM with their tick count and stamped once it is, so a
+# reboot never writes times from the RTC's 2000 epoch to flash.
+import os
+import struct
+import clock
+from compat import ticks_ms, ticks_diff
+
+LOG_DIR = "samples"
+RECORD = "<IhH"
+RECORD_SIZE = struct.calcsize(RECORD)  # 8 bytes
+LOG_INTERVAL = 60           # seconds averaged into one record
+BLOCK_RECORDS = 64          # one 512-byte write
+FLUSH_MS = 15 * 60 * 1000   # a partial block is written at least this often
+SEGMENT_BYTES = 32768       # 4096 records, ~2.8 days at one per minute
+MAX_SEGMENTS = 16           # 512 KB, ~6 weeks
+CSV_ROWS = 32               # rows per chunk when streaming CSV
+EARLY_SAMPLES = 128         # samples held while the clock is unset (~4 min at 2 s)
+
+
+class SampleLog:
+    def __init__(self, directory=LOG_DIR, interval=LOG_INTERVAL, segment_bytes=SEGMENT_BYTES,
+                 max_segments=MAX_SEGMENTS):
+        self.dir = directory
+        self.interval = interval
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.block = bytearray(BLOCK_RECORDS * RECORD_SIZE)
+        self.pending = 0        # records in block
+        self.flushed = ticks_ms()
+        self.writes = 0
+        self.write_errors = 0
+        self.early = []         # (ticks_ms, temp, hum) waiting for the clock
+        self.early_dropped = 0
+        # Open interval accumulators
+        self.start = None
+        self.n = 0
+        self.tsum = self.hsum = 0
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass  # already there
+        self.segments = self._scan()
+
+    def _scan(self):
+        names = [name for name in os.listdir(self.dir) if name.endswith(".bin")]
+        return sorted(int(name[:-4]) for name in names)
+
+    def _path(self, segment):
+        return "%s/%05d.bin" % (self.dir, segment)
+
+    # Matches the DHTSampler listener signature
+    def add(self, ts, temp, hum):
+        if not clock.valid():
+            if len(self.early) >= EARLY_SAMPLES:
+                self.early.pop(0)
+                self.early_dropped += 1
+            self.early.append((ticks_ms(), temp, hum))
+            return
+        if self.early:
+            # Stamp the held samples by how long ago they were taken
+            now, now_ticks = clock.now(), ticks_ms()
+            early, self.early = self.early, []
+            for ticks, t, h in early:
+                self._add(now - ticks_diff(now_ticks, ticks) // 1000, t, h)
+        self._add(ts, temp, hum)
+
+    def _add(self, ts, temp, hum):
+        ts = int(ts)
+        bucket = ts - ts % self.interval if self.interval else ts
+        if bucket != self.start:
+            if self.n:
+                self._record(self.start, (self.tsum + self.n // 2) // self.n,
+                             (self.hsum + self.n // 2) // self.n)
+            self.start = bucket
+            self.n = 0
+            self.tsum = self.hsum = 0
+        self.n += 1
+        self.tsum += int(round(temp * 10))
+        self.hsum += int(round(hum * 10))
+
+    def _record(self, ts, temp10, hum10):
+        struct.pack_into(RECORD, self.block, self.pending * RECORD_SIZE, ts, temp10, hum10)
+        self.pending += 1
+        if self.pending == BLOCK_RECORDS or ticks_diff(ticks_ms(), self.flushed) >= FLUSH_MS:
+            self.flush()
+
+    def flush(self):
+        self.flushed = ticks_ms()
+        if not self.pending:
+            return
+        segment = self.segments[-1] if self.segments else 0
+        path = self._path(segment)
+        try:
+            size = os.stat(path)[6] if self.segments else 0
+            # A torn tail would misalign everything appended after it
+            if size >= self.segment_bytes or size % RECORD_SIZE:
+                segment += 1
+                path = self._path(segment)
+            with open(path, "ab") as f:
+                f.write(memoryview(self.block)[:self.pending * RECORD_SIZE])
+        except OSError as e:
+            # Keep the block; the next flush tries again (full flash, bad sector)
+            self.write_errors += 1
+            print("Sample log write failed:", e)
+            if self.pending == BLOCK_RECORDS:
+                self.pending = 0  # cannot hold more; drop the block
+            return
+        self.writes += 1
+        self.pending = 0
+        if not self.segments or segment != self.segments[-1]:
+            self.segments.append(segment)
+        while len(self.segments) > self.max_segments:
+            try:
+                os.remove(self._path(self.segments.pop(0)))
+            except OSError:
+                pass
+
+    # Records oldest first: flash segments, then the block not yet written.
+    # `since` is Unix time, like the records.
+    def records(self, since=0):
+        buf = bytearray(BLOCK_RECORDS * RECORD_SIZE)
+        mv = memoryview(buf)
+        for segment in list(self.segments):
+            try:
+                f = open(self._path(segment), "rb")
+            except OSError:
+                continue  # rotated away while streaming
+            with f:
+                while True:
+                    n = f.readinto(buf) // RECORD_SIZE
+                    if not n:
+                        break
+                    for i in range(n):
+                        row = struct.unpack_from(RECORD, mv, i * RECORD_SIZE)
+                        if row[0] >= since:
+                            yield row
+        for i in range(self.pending):
+            row = struct.unpack_from(RECORD, self.block, i * RECORD_SIZE)
+            if row[0] >= since:
+                yield row
+
+    # Streams "ts,temp,hum" lines in chunks of CSV_ROWS rows
+    def iter_csv(self, since=0):
+        yield "ts,temp,hum\n"
+        lines = []
+        for ts, temp10, hum10 in self.records(since):
+            lines.append("%d,%.1f,%.1f\n" % (ts, temp10 / 10, hum10 / 10))
+            if len(lines) == CSV_ROWS:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+    def status(self):
+        size = 0
+        for segment in self.segments:
+            try:
+                size += os.stat(self._path(segment))[6]
+            except OSError:
+                pass
+        return {"segments": len(self.segments), "bytes": size, "pending": self.pending,
+                "writes": self.writes, "write_errors": self.write_errors,
+                "held": len(self.early), "held_dropped": self.early_dropped}
@@ -0,0 +1,150 @@
+# === In-RAM sensor history ===
+# Fixed-size ring buffers backed by array.array, so adding a sample never
+# allocates. Temperatures and humidities are stored as int16 tenths.
+# Raw samples plus per-minute and per-hour min/avg/max rollups are kept
+# side by side; each rollup is updated once per sample, never rescanned.
+from array import array
+
+RAW_FIELDS = ("ts", "temp", "hum")
+ROLLUP_FIELDS = ("ts", "temp_min", "temp_avg", "temp_max", "hum_min", "hum_avg", "hum_max")
+CHUNK_ROWS = 16  # rows per chunk when streaming JSON
+
+
+def _tenths(value):
+    return int(round(value * 10))
+
+
+class RawRing:
+    def __init__(self, size):
+        self.size = size
+        self.ts = array("l", [0] * size)
+        self.temp = array("h", [0] * size)
+        self.hum = array("h", [0] * size)
+        self.count = 0
+        self.head = 0  # next slot to write
+
+    def add(self, ts, temp10, hum10):
+        i = self.head
+        self.ts[i] = ts
+        self.temp[i] = temp10
+        self.hum[i] = hum10
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def rows(self, limit=None):
+        n = self.count if limit is None else min(limit, self.count)
+        start = (self.head - n) % self.size
+        for k in range(n):
+            i = (start + k) % self.size
+            yield (self.ts[i], self.temp[i] / 10, self.hum[i] / 10)
+
+
+class Rollup:
+    def __init__(self, period, size):
+        self.period = period  # seconds per bucket
+        self.size = size
+        self.ts = array("l", [0] * size)
+        self.tmin = array("h", [0] * size)
+        self.tavg = array("h", [0] * size)
+        self.tmax = array("h", [0] * size)
+        self.hmin = array("h", [0] * size)
+        self.havg = array("h", [0] * size)
+        self.hmax = array("h", [0] * size)
+        self.count = 0
+        self.head = 0
+        # Open bucket accumulators
+        self.start = None
+        self.n = 0
+        self.tsum = self.hsum = 0
+        self.tlo = self.thi = self.hlo = self.hhi = 0
+
+    def add(self, ts, temp10, hum10):
+        bucket = ts - ts % self.period
+        if bucket != self.start:
+            if self.n:
+                self._close()
+            self.start = bucket
+            self.n = 0
+            self.tsum = self.hsum = 0
+            self.tlo = self.thi = temp10
+            self.hlo = self.hhi = hum10
+        self.n += 1
+        self.tsum += temp10
+        self.hsum += hum10
+        if temp10 < self.tlo:
+            self.tlo = temp10
+        elif temp10 > self.thi:
+            self.thi = temp10
+        if hum10 < self.hlo:
+            self.hlo = hum10
+        elif hum10 > self.hhi:
+            self.hhi = hum10
+
+    def _open_row(self):
+        n = self.n
+        return (self.start, self.tlo, (self.tsum + n // 2) // n, self.thi,
+                self.hlo, (self.hsum + n // 2) // n, self.hhi)
+
+    def _close(self):
+        i = self.head
+        (self.ts[i], self.tmin[i], self.tavg[i], self.tmax[i],
+         self.hmin[i], self.havg[i], self.hmax[i]) = self._open_row()
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def rows(self, limit=None):
+        # Closed buckets oldest first, then the bucket still being filled
+        closed = self.count
+        if limit is not None:
+            closed = min(closed, max(limit - (1 if self.n else 0), 0))
+        start = (self.head - closed) % self.size
+        for k in range(closed):
+            i = (start + k) % self.size
+            yield (self.ts[i], self.tmin[i] / 10, self.tavg[i] / 10, self.tmax[i] / 10,
+                   self.hmin[i] / 10, self.havg[i] / 10, self.hmax[i] / 10)
+        if self.n and (limit is None or limit > 0):
+            row = self._open_row()
+            yield (row[0],) + tuple(v / 10 for v in row[1:])
+
+
+class SensorHistory:
+    def __init__(self, raw_size=180, minute_size=120, hour_size=168):
+        self.raw = RawRing(raw_size)            # ~6 min at a 2 s sample period
+        self.minute = Rollup(60, minute_size)   # 2 hours
+        self.hour = Rollup(3600, hour_size)     # 7 days
+
+    # Matches the DHTSampler listener signature
+    def add(self, ts, temp, hum):
+        ts = int(ts)
+        temp10 = _tenths(temp)
+        hum10 = _tenths(hum)
+        self.raw.add(ts, temp10, hum10)
+        self.minute.add(ts, temp10, hum10)
+        self.hour.add(ts, temp10, hum10)
+
+    def series(self, res):
+        if res == "raw":
+            return self.raw, RAW_FIELDS, 0
+        if res == "minute":
+            return self.minute, ROLLUP_FIELDS, 60
+        if res == "hour":
+            return self.hour, ROLLUP_FIELDS, 3600
+        raise ValueError("unknown resolution: " + str(res))
+
+    # Streams {"res", "period", "fields", "points": [[...], ...]} in small chunks
+    def iter_json(self, res, limit=None):
+        ring, fields, period = self.series(res)
+        yield '{"res": "%s", "period": %d, "fields": ["%s"], "points": [' % (res, period, '", "'.join(fields))
+        rows = []
+        first = True
+        for row in ring.rows(limit):
+            rows.append("[" + ", ".join(str(v) for v in row) + "]")
+            if len(rows) == CHUNK_ROWS:
+                yield ("" if first else ", ") + ", ".join(rows)
+                first = False
+                rows = []
+        if rows:
+            yield ("" if first else ", ") + ", ".join(rows)
+        yield "]}"
@@ -0,0 +1,212 @@
+# === In-process hardware simulators (CPython only) ===
+# Stand-ins for the MicroPython network, machine, neopixel, dht and ssd1306
+# modules so both web apps run on a desktop for load tests and profiling.
+# Behaviour is tuned through class attributes, e.g.
+#     SimDHT11.latency_ms = 25; SimDHT11.fail_rate = 0.1
+import random
+import time
+from collections import deque
+from types import SimpleNamespace
+
+
+# === network ===
+class SimWLAN:
+    connect_delay_ms = 0      # time until isconnected() turns True
+    fail_connect = False      # never associate (upstream SSID down)
+    ip = "127.0.0.1"
+
+    def __init__(self, interface):
+        self.interface = interface
+        self._active = False
+        self._connect_started = None
+        self._config = {"essid": "", "channel": 1}
+        self._ifconfig = (self.ip, "255.255.255.0", self.ip, "8.8.8.8")
+
+    def active(self, *value):
+        if value:
+            self._active = bool(value[0])
+        return self._active
+
+    def connect(self, ssid=None, password=None, **kwargs):
+        self._config["essid"] = ssid
+        self._connect_started = time.monotonic()
+
+    def disconnect(self):
+        self._connect_started = None
+
+    def isconnected(self):
+        if self.interface == network.AP_IF:
+            return self._active
+        if self._connect_started is None or self.fail_connect:
+            return False
+        return (time.monotonic() - self._connect_started) * 1000 >= self.connect_delay_ms
+
+    def status(self, *args):
+        if args:
+            return -60 if args[0] == "rssi" else None
+        return 1010 if self.isconnected() else 1001  # STAT_GOT_IP / STAT_CONNECTING
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def ifconfig(self, *args):
+        if args:
+            self._ifconfig = tuple(args[0])
+        return self._ifconfig
+
+
+network = SimpleNamespace(STA_IF=0, AP_IF=1, AUTH_OPEN=0, AUTH_WPA2_PSK=3, STAT_GOT_IP=1010,
+                          WLAN=SimWLAN)
+
+
+# === machine ===
+class SimPin:
+    def __init__(self, pin_id, *args, **kwargs):
+        self.id = pin_id
+
+
+class SimSoftI2C:
+    def __init__(self, scl=None, sda=None, freq=400000):
+        self.scl = scl
+        self.sda = sda
+        self.bytes_written = 0
+
+
+machine = SimpleNamespace(Pin=SimPin, SoftI2C=SimSoftI2C, I2C=SimSoftI2C)
+
+
+# === dht ===
+class SimDHT11:
+    latency_ms = 0      # blocking time of measure(), like the real bus transfer
+    fail_rate = 0.0     # probability that measure() raises OSError
+    script = None       # optional list of (temp, hum) readings, cycled through
+    start = (26, 45)
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.measurements = 0
+        self._temp, self._hum = self.start
+
+    def measure(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        self.measurements += 1
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise OSError(116)  # ETIMEDOUT, as the real driver reports it
+        if self.script:
+            self._temp, self._hum = self.script[(self.measurements - 1) % len(self.script)]
+        else:
+            # Small random walk inside the DHT11 range
+            self._temp = min(50, max(0, self._temp + random.choice((-1, 0, 0, 1))))
+            self._hum = min(90, max(20, self._hum + random.choice((-1, 0, 0, 1))))
+
+    def temperature(self):
+        return self._temp
+
+    def humidity(self):
+        return self._hum
+
+
+dht = SimpleNamespace(DHT11=SimDHT11, DHT22=SimDHT11)
+
+
+# === ssd1306 ===
+class SimSSD1306:
+    def __init__(self, width, height, i2c, addr=0x3C):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.i2c = i2c
+        self.buffer = bytearray(self.pages * width)
+        self.text_rows = {}   # y -> last text drawn there
+        self.shows = 0        # full-frame transfers
+        self.page_writes = 0  # partial transfers through write_data
+        self.bytes_sent = 0
+        self._cmds = []
+
+    def fill(self, c):
+        self.buffer[:] = bytes([0xFF if c else 0]) * len(self.buffer)
+        if not c:
+            self.text_rows = {}
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0
+        i = (y // 8) * self.width + x
+        bit = 1 << (y % 8)
+        if c is None:
+            return 1 if self.buffer[i] & bit else 0
+        if c:
+            self.buffer[i] |= bit
+        else:
+            self.buffer[i] &= ~bit & 0xFF
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(max(y, 0), min(y + h, self.height)):
+            for xx in range(max(x, 0), min(x + w, self.width)):
+                self.pixel(xx, yy, c)
+        for row in [r for r in self.text_rows if y <= r < y + h]:
+            del self.text_rows[row]
+
+    # No font here: each character becomes a solid 6x7 block
+    def text(self, s, x, y, c=1):
+        self.text_rows[y] = s
+        for n, ch in enumerate(s):
+            if ch != " ":
+                for yy in range(y, y + 7):
+                    for xx in range(x + n * 8, x + n * 8 + 6):
+                        self.pixel(xx, yy, c)
+
+    def write_cmd(self, cmd):
+        self._cmds.append(cmd)
+
+    def write_data(self, buf):
+        self.page_writes += 1
+        self.bytes_sent += len(buf)
+        self.i2c.bytes_written += len(buf)
+        self._cmds = []
+
+    def show(self):
+        self.shows += 1
+        self.bytes_sent += len(self.buffer)
+        self.i2c.bytes_written += len(self.buffer)
+
+    def screen(self):
+        return [self.text_rows[y] for y in sorted(self.text_rows)]
+
+
+ssd1306 = SimpleNamespace(SSD1306_I2C=SimSSD1306)
+
+
+# === neopixel ===
+WRITE_HISTORY = 256  # writes kept for inspection; effects write at 50 Hz without end
+
+
+class SimNeoPixel:
+    def __init__(self, pin, n, bpp=3):
+        self.pin = pin
+        self.n = n
+        self._pixels = [(0,) * bpp] * n
+        self.written = deque((), WRITE_HISTORY)  # last (monotonic time, tuple of pixels) per write()
+        self.writes = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return self._pixels[i]
+
+    def __setitem__(self, i, color):
+        self._pixels[i] = tuple(color)
+
+    def fill(self, color):
+        self._pixels = [tuple(color)] * self.n
+
+    def write(self):
+        self.written.append((time.monotonic(), tuple(self._pixels)))
+        self.writes += 1
+
+
+neopixel = SimpleNamespace(NeoPixel=SimNeoPixel)
@@ -0,0 +1,52 @@
+# === Pre-rendered static assets ===
+# A page shell is encoded (and gzip-compressed when the firmware can) once
+# at boot. Each request then costs a header compare: matching ETags get a 304,
+# everything else gets the stored bytes with long-lived cache headers.
+import binascii
+
+MAX_AGE = 3600  # seconds browsers may reuse the asset without asking
+
+
+def gzip_bytes(data):
+    try:
+        import gzip
+        return gzip.compress(data, mtime=0)
+    except ImportError:
+        pass
+    try:
+        import io
+        import deflate  # MicroPython 1.21+, if built with compression
+        buf = io.BytesIO()
+        with deflate.DeflateIO(buf, deflate.GZIP) as f:
+            f.write(data)
+        return buf.getvalue()
+    except Exception:
+        return None
+
+
+class StaticAsset:
+    def __init__(self, body, content_type, max_age=MAX_AGE, compress=True):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.content_type = content_type
+        self.cache_control = f"public, max-age={max_age}"
+        self.etag = '"%08x"' % (binascii.crc32(self.body) & 0xffffffff)
+        self.gz = gzip_bytes(self.body) if compress else None
+        if self.gz is not None and len(self.gz) >= len(self.body):
+            self.gz = None
+        self.gz_etag = self.etag[:-1] + '-gz"'
+        print("Static asset:", len(self.body), "bytes,", len(self.gz) if self.gz else "no", "gzip")
+
+    def reply(self, req):
+        use_gz = self.gz is not None and "gzip" in req.header("accept-encoding", "")
+        etag = self.gz_etag if use_gz else self.etag
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if self.gz is not None:
+            headers["Vary"] = "Accept-Encoding"
+        if_none_match = req.header("if-none-match")
+        if if_none_match in (self.etag, self.gz_etag):
+            headers["ETag"] = if_none_match
+            return "304 Not Modified", self.content_type, b"", headers
+        if use_gz:
+            headers["Content-Encoding"] = "gzip"
+            return "200 OK", self.content_type, self.gz, headers
+        return "200 OK", self.content_type, self.body, headers
@@ -0,0 +1,72 @@
+# === Precompiled page templates ===
+# A Template splits its source once into constant byte chunks and {{slot}}
+# placeholders, keeping all constant text in a single bytes object. Rendering
+# only encodes the slot values; the constant parts are handed to the socket as
+# memoryview slices of that object, so a response never builds the full page
+# in RAM. Slots take an optional filter: {{name|html}} or {{name|json}}.
+import json
+
+OPEN = "{{"
+CLOSE = "}}"
+
+
+def escape_html(s):
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+FILTERS = {
+    "": str,
+    "html": lambda v: escape_html(str(v)),
+    "json": json.dumps,
+}
+
+
+class Rendering:
+    # Iterable body with a known length, so it goes out with Content-Length
+    def __init__(self, template, values):
+        self.template = template
+        self.values = [FILTERS[f](values[name]).encode() for name, f in template.slots]
+        self.length = template.const_length + sum(len(v) for v in self.values)
+
+    def __iter__(self):
+        mv = memoryview(self.template.blob)
+        offsets = self.template.offsets
+        for i, value in enumerate(self.values):
+            yield mv[offsets[i]:offsets[i + 1]]
+            yield value
+        yield mv[offsets[-2]:offsets[-1]]
+
+
+class Template:
+    def __init__(self, source):
+        consts = []
+        self.slots = []  # (name, filter) between consecutive constant chunks
+        pos = 0
+        while True:
+            start = source.find(OPEN, pos)
+            if start < 0:
+                break
+            end = source.find(CLOSE, start)
+            if end < 0:
+                raise ValueError("unclosed slot at %d" % start)
+            consts.append(source[pos:start])
+            name, _, f = source[start + len(OPEN):end].strip().partition("|")
+            if f not in FILTERS:
+                raise ValueError("unknown filter: " + f)
+            self.slots.append((name, f))
+            pos = end + len(CLOSE)
+        consts.append(source[pos:])
+
+        encoded = [c.encode() for c in consts]
+        self.blob = b"".join(encoded)
+        self.offsets = [0]
+        for c in encoded:
+            self.offsets.append(self.offsets[-1] + len(c))
+        self.const_length = len(self.blob)
+
+    def render(self, **values):
+        return Rendering(self, values)
+
+    # Whole page as bytes, for content rendered once (static shells)
+    def render_bytes(self, **values):
+        return b"".join(bytes(chunk) for chunk in self.render(**values))
@@ -0,0 +1,144 @@
+# === Weather classification and derived comfort metrics ===
+# The rules are compiled once into a lookup table over the DHT11's integer
+# domain (0-50 C, 20-90 %RH), so classifying a reading is one index into a
+# bytearray. Sites can override the rules with a weather_rules.json file:
+#     {"rules": [["Normal", 25, 30, 40, 50], ...], "fallback": "Other"}
+# Each rule is [label, temp_min, temp_max, hum_min, hum_max]; bounds are
+# inclusive, null means open, and the first matching rule wins.
+import json
+import math
+from array import array
+
+RULES_FILE = "weather_rules.json"
+TEMP_RANGE = (0, 50)   # DHT11 measuring range
+HUM_RANGE = (20, 90)
+UNKNOWN = "Unknown"
+
+# The original thresholds, with the strict comparisons moved onto integers
+# (temp < 25 is temp <= 24, hum > 64 is hum >= 65, ...)
+DEFAULT_RULES = (
+    ("Normal", 25, 30, 40, 50),
+    ("Dry or Cool", None, 24, None, 39),
+    ("Cool or Moist", 20, 30, 65, None),
+    ("Hot or Dry", 41, None, None, 49),
+)
+DEFAULT_FALLBACK = "Other"
+
+
+def _in(value, lo, hi):
+    return (lo is None or value >= lo) and (hi is None or value <= hi)
+
+
+class WeatherRules:
+    def __init__(self, rules=DEFAULT_RULES, fallback=DEFAULT_FALLBACK):
+        self.rules = [tuple(rule) for rule in rules]
+        self.labels = [rule[0] for rule in self.rules] + [fallback]
+        self.columns = HUM_RANGE[1] - HUM_RANGE[0] + 1
+        rows = TEMP_RANGE[1] - TEMP_RANGE[0] + 1
+        self.table = bytearray(rows * self.columns)  # label index per (temp, hum)
+        for t in range(rows):
+            for h in range(self.columns):
+                self.table[t * self.columns + h] = self._match(t + TEMP_RANGE[0], h + HUM_RANGE[0])
+
+    @classmethod
+    def load(cls, path=RULES_FILE):
+        try:
+            with open(path) as f:
+                config = json.load(f)
+            rules = cls(config["rules"], config.get("fallback", DEFAULT_FALLBACK))
+            print("Weather rules loaded from", path)
+            return rules
+        except OSError:
+            return cls()
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            print("Bad weather rules, using defaults:", e)
+            return cls()
+
+    # Index of the first matching rule, or of the fallback label
+    def _match(self, temp, hum):
+        for i, (label, tlo, thi, hlo, hhi) in enumerate(self.rules):
+            if _in(temp, tlo, thi) and _in(hum, hlo, hhi):
+                return i
+        return len(self.rules)
+
+    def classify(self, temp, hum):
+        if temp is None or hum is None or temp == "Error" or hum == "Error":
+            return UNKNOWN
+        t = int(round(float(temp)))
+        h = int(round(float(hum)))
+        if TEMP_RANGE[0] <= t <= TEMP_RANGE[1] and HUM_RANGE[0] <= h <= HUM_RANGE[1]:
+            return self.labels[self.table[(t - TEMP_RANGE[0]) * self.columns + h - HUM_RANGE[0]]]
+        return self.labels[self._match(t, h)]  # outside the table (another sensor)
+
+
+# === Derived metrics ===
+def dew_point(temp, hum):
+    # Magnus formula
+    gamma = math.log(max(hum, 1) / 100) + 17.62 * temp / (243.12 + temp)
+    return 243.12 * gamma / (17.62 - gamma)
+
+
+def heat_index(temp, hum):
+    # NOAA: Steadman's approximation, Rothfusz regression above about 27 C
+    t = temp * 9 / 5 + 32
+    hi = 0.5 * (t + 61 + (t - 68) * 1.2 + hum * 0.094)
+    if (hi + t) / 2 >= 80:
+        hi = (-42.379 + 2.04901523 * t + 10.14333127 * hum - 0.22475541 * t * hum
+              - 6.83783e-3 * t * t - 5.481717e-2 * hum * hum + 1.22874e-3 * t * t * hum
+              + 8.5282e-4 * t * hum * hum - 1.99e-6 * t * t * hum * hum)
+        if hum < 13 and 80 <= t <= 112:
+            hi -= (13 - hum) / 4 * math.sqrt((17 - abs(t - 95)) / 17)
+        elif hum > 85 and 80 <= t <= 87:
+            hi += (hum - 85) / 10 * (87 - t) / 5
+    return (hi - 32) * 5 / 9
+
+
+AVG_WINDOW = 30  # samples in the moving averages (one minute at the 2 s sampling period)
+
+
+class ComfortMetrics:
+    def __init__(self, rules, window=AVG_WINDOW):
+        self.rules = rules
+        self.window = window
+        self.ts = array("l", [0] * window)
+        self.temp = array("h", [0] * window)  # tenths
+        self.hum = array("h", [0] * window)
+        self.count = 0
+        self.head = 0
+        self.temp_sum = 0
+        self.hum_sum = 0
+        self.values = {}
+
+    # Sampler listener: everything is computed here, once per reading
+    def add(self, ts, temp, hum):
+        i = self.head
+        if self.count == self.window:
+            self.temp_sum -= self.temp[i]
+            self.hum_sum -= self.hum[i]
+        else:
+            self.count += 1
+        self.ts[i] = int(ts)
+        self.temp[i] = int(round(temp * 10))
+        self.hum[i] = int(round(hum * 10))
+        self.temp_sum += self.temp[i]
+        self.hum_sum += self.hum[i]
+        self.head = (i + 1) % self.window
+
+        # Rate of change across the window, per minute
+        oldest = (self.head - self.count) % self.window
+        span = self.ts[i] - self.ts[oldest]
+        temp_rate = hum_rate = 0.0
+        if span > 0:
+            temp_rate = (self.temp[i] - self.temp[oldest]) / 10 * 60 / span
+            hum_rate = (self.hum[i] - self.hum[oldest]) / 10 * 60 / span
+
+        self.values = {
+            "weather": self.rules.classify(temp, hum),
+            "dew_point": round(dew_point(temp, hum), 1),
+            "heat_index": round(heat_index(temp, hum), 1),
+            "temp_avg": round(self.temp_sum / self.count / 10, 1),
+            "hum_avg": round(self.hum_sum / self.count / 10, 1),
+            "temp_rate": round(temp_rate, 2),  # C per minute
+            "hum_rate": round(hum_rate, 2),    # %RH per minute
+            "samples": self.count,
+        }
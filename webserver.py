@@ -0,0 +1,332 @@
+# === Shared HTTP server core ===
+# Both web apps hand a request handler to one of the loops below.
+# A handler takes a parsed http_request.Request and returns
+# (status, content_type, body) or (status, content_type, body, extra_headers),
+# or None to drop the connection without a reply. The body is a str/bytes or
+# an iterable of str/bytes chunks that is streamed without joining it first
+# (with a `length` attribute when the total size is known up front).
+# In asyncio mode a body with an async stream(writer) method (such as an
+# EventStream) takes over the connection until the client goes away.
+# Both loops take an optional metrics.Metrics that times parse, render
+# (the handler) and send for every request.
+import socket
+from compat import asyncio, ticks_us
+from http_request import RequestReader, HTTPError
+
+RECV_TIMEOUT = 5        # seconds a client gets to send a complete request
+SEND_TIMEOUT = 10       # seconds a client may stall the response before it is dropped
+KEEPALIVE_TIMEOUT = 10  # seconds an idle persistent connection stays open
+MAX_REQUESTS = 100      # requests served on one connection before it is closed
+
+# === Admission control ===
+# Beyond MAX_CLIENTS open connections a new one gets a canned 503 before its
+# request is even read. From KEEPALIVE_LIMIT on, responses close the
+# connection, so idle persistent connections do not hold slots under load.
+# Server-Sent Event streams stay open as long as the page does, so once a
+# connection turns into a stream it moves from "active" to "streams", which
+# has its own cap; open tabs never lock out ordinary requests.
+MAX_CLIENTS = 10
+KEEPALIVE_LIMIT = 6
+MAX_STREAMS = 32
+BUSY = (b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain\r\nContent-Length: 5\r\n"
+        b"Retry-After: 1\r\nConnection: close\r\n\r\nBusy\n")
+connections = {"active": 0, "streams": 0, "rejected": 0, "timeouts": 0}
+
+
+def response_head(status, content_type, headers=None, length=None, keep_alive=False):
+    head = f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+    if status.startswith("304"):
+        pass  # never has a body
+    elif length is not None:
+        head += f"Content-Length: {length}\r\n"
+    elif keep_alive:
+        head += "Transfer-Encoding: chunked\r\n"
+    if keep_alive:
+        head += f"Connection: keep-alive\r\nKeep-Alive: timeout={KEEPALIVE_TIMEOUT}, max={MAX_REQUESTS}\r\n"
+    else:
+        head += "Connection: close\r\n"
+    if headers:
+        for name, value in headers.items():
+            head += f"{name}: {value}\r\n"
+    return head + "\r\n"
+
+
+def body_chunks(body):
+    if isinstance(body, (str, bytes, bytearray, memoryview)):
+        body = (body,)
+    for chunk in body:
+        yield chunk.encode() if isinstance(chunk, str) else chunk
+
+
+# Splits a handler reply into its parts; fixed bodies get their byte length
+def unpack_reply(reply):
+    status, content_type, body = reply[:3]
+    headers = reply[3] if len(reply) > 3 else None
+    if isinstance(body, str):
+        body = body.encode()
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        length = len(body)
+    else:
+        length = getattr(body, "length", None)  # e.g. a template Rendering
+    if status.startswith("304"):
+        body, length = b"", 0
+    return status, content_type, body, headers, length
+
+
+def error_reply(e):
+    return e.status, "text/plain", e.status
+
+
+# === Blocking mode (one connection at a time) ===
+# Connections are always closed after one response here: a persistent
+# connection would keep every other client waiting in the accept queue.
+# `idle` runs after each connection is closed, off the request path, and at
+# least every IDLE_INTERVAL seconds while no client connects.
+IDLE_INTERVAL = 0.5
+
+
+def serve_blocking(handler, host, port=80, idle=None, metrics=None, ready=None):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((host, port))
+    s.listen(5)
+    print("Serving (blocking) on", host, port)
+    if ready is not None:
+        ready()
+    if idle is not None:
+        s.settimeout(IDLE_INTERVAL)
+
+    reader = RequestReader()  # one buffer reused for every connection
+    while True:
+        try:
+            conn, addr = s.accept()
+        except OSError:  # accept timed out
+            idle()
+            continue
+        conn.settimeout(RECV_TIMEOUT)  # per recv; read_blocking enforces the total
+        reader.reset()
+        try:
+            req = None
+            head_only = False
+            t = ticks_us()
+            try:
+                req = reader.read_blocking(conn, RECV_TIMEOUT * 1000)
+                if req is not None:
+                    req.client = addr[0]
+                if req is not None and metrics:
+                    metrics.phase("parse", reader.started)
+                t = ticks_us()
+                reply = handler(req) if req is not None else None
+                head_only = req is not None and req.method == "HEAD"
+            except HTTPError as e:
+                reply = error_reply(e)
+            if reply is not None:
+                if metrics:
+                    t = metrics.phase("render", t)
+                status, content_type, body, headers, length = unpack_reply(reply)
+                conn.settimeout(SEND_TIMEOUT)
+                conn.send(response_head(status, content_type, headers, length).encode())
+                if not head_only:
+                    for chunk in body_chunks(body):
+                        conn.sendall(chunk)
+                if metrics:
+                    metrics.phase("send", t)
+                    metrics.request(req, status, reader.started)
+        except OSError as e:
+            connections["timeouts"] += 1  # recv/send timed out or the client reset
+            print("Error:", e)
+        except Exception as e:
+            print("Error:", e)
+        finally:
+            conn.close()
+        if idle is not None:
+            idle()
+
+
+# === asyncio mode (many connections at once) ===
+DRAIN_BYTES = 1460  # drain after roughly one TCP segment of small chunks
+
+
+# A client that stops reading is dropped instead of holding its slot forever
+async def _drain(writer):
+    await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+
+
+async def _write_chunks(writer, body):
+    pending = 0
+    for chunk in body_chunks(body):
+        writer.write(chunk)
+        pending += len(chunk)
+        if pending >= DRAIN_BYTES:
+            await _drain(writer)
+            pending = 0
+
+
+# Returns False when the connection must be closed after this response
+async def _send(writer, reply, keep_alive, head_only=False):
+    status, content_type, body, headers, length = unpack_reply(reply)
+    if hasattr(body, "stream"):
+        writer.write(response_head(status, content_type, headers).encode())
+        await body.stream(writer)
+        return False
+    writer.write(response_head(status, content_type, headers, length, keep_alive).encode())
+    if head_only or length == 0:
+        pass
+    elif isinstance(body, (bytes, bytearray, memoryview)):
+        writer.write(body)
+    elif length is not None:
+        await _write_chunks(writer, body)
+    elif keep_alive:
+        # Unknown length on a persistent connection: chunked encoding
+        for chunk in body_chunks(body):
+            if chunk:
+                writer.write(("%x\r\n" % len(chunk)).encode())
+                writer.write(chunk)
+                writer.write(b"\r\n")
+                await _drain(writer)
+        writer.write(b"0\r\n\r\n")
+    else:
+        await _write_chunks(writer, body)
+    await _drain(writer)
+    return keep_alive
+
+
+async def _reject(writer):
+    connections["rejected"] += 1
+    try:
+        writer.write(BUSY)
+        await _drain(writer)
+    except Exception:
+        pass
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _serve_client(handler, reader, writer, metrics=None):
+    if connections["active"] >= MAX_CLIENTS:
+        await _reject(writer)
+        return
+    connections["active"] += 1
+    slot = "active"  # becomes "streams" once the connection turns into an event stream
+    peer = writer.get_extra_info("peername")
+    requests = RequestReader()
+    served = 0
+    try:
+        while served < MAX_REQUESTS:
+            # Pipelined requests are already buffered and parse without waiting
+            timeout = KEEPALIVE_TIMEOUT if served else RECV_TIMEOUT
+            try:
+                req = await asyncio.wait_for(requests.read(reader), timeout)
+            except asyncio.TimeoutError:
+                if requests.end:
+                    connections["timeouts"] += 1  # started a request but never finished it
+                break
+            except HTTPError as e:
+                reply = error_reply(e)
+                await _send(writer, reply, False)
+                if metrics:
+                    metrics.request(None, reply[0], requests.started)
+                break
+            if req is None:
+                break
+            req.client = peer[0] if peer else None
+            served += 1
+            if metrics:
+                metrics.phase("parse", requests.started)
+            t = ticks_us()
+            reply = handler(req)
+            if reply is None:
+                break
+            if hasattr(reply[2], "stream"):
+                if connections["streams"] >= MAX_STREAMS:
+                    connections["rejected"] += 1
+                    reply = "503 Service Unavailable", "text/plain", "Busy", {"Retry-After": 1}
+                else:
+                    connections["active"] -= 1
+                    connections["streams"] += 1
+                    slot = "streams"
+            keep_alive = (served < MAX_REQUESTS and connections["active"] <= KEEPALIVE_LIMIT
+                          and req.keep_alive())
+            if metrics:
+                t = metrics.phase("render", t)
+                if reply[1] == "text/event-stream":
+                    metrics.request(req, reply[0])  # counted, but its duration is the whole stream
+            keep_alive = await _send(writer, reply, keep_alive, req.method == "HEAD")
+            if metrics and reply[1] != "text/event-stream":
+                metrics.phase("send", t)
+                metrics.request(req, reply[0], requests.started)
+            if not keep_alive:
+                break
+    except asyncio.TimeoutError:
+        connections["timeouts"] += 1  # stalled while we were sending
+    except Exception as e:
+        print("Error:", e)
+    finally:
+        connections[slot] -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+# `ready` is called once the listening socket is up
+async def serve_async(handler, host, port=80, background=(), metrics=None, ready=None):
+    await asyncio.start_server(lambda r, w: _serve_client(handler, r, w, metrics), host, port,
+                               backlog=MAX_CLIENTS)
+    print("Serving (asyncio) on", host, port)
+    if ready is not None:
+        ready()
+    for coro in background:
+        asyncio.create_task(coro)
+    while True:
+        await asyncio.sleep(3600)
+
+
+# === Server-Sent Events ===
+SSE_HEARTBEAT = 15      # seconds between keep-alive comments on an idle stream
+SSE_MAX_PENDING = 16    # a client this far behind is dropped; EventSource reconnects
+
+
+class EventStream:
+    def __init__(self, hub, first):
+        self.hub = hub
+        self.pending = [] if first is None else [first]
+        self.event = asyncio.Event()
+        self.closed = False
+
+    def push(self, data):
+        if len(self.pending) >= SSE_MAX_PENDING:
+            self.closed = True
+        else:
+            self.pending.append(data)
+        self.event.set()
+
+    async def stream(self, writer):
+        writer.write(b"retry: 2000\n\n")
+        self.hub.clients.append(self)
+        try:
+            while not self.closed:
+                self.event.clear()
+                while self.pending:
+                    writer.write(b"data: " + self.pending.pop(0).encode() + b"\n\n")
+                await _drain(writer)
+                try:
+                    await asyncio.wait_for(self.event.wait(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+        finally:
+            self.hub.clients.remove(self)
+
+
+class EventHub:
+    def __init__(self):
+        self.clients = []
+
+    # Reply for an SSE route; `first` is sent before any published event
+    def subscribe(self, first=None):
+        return "200 OK", "text/event-stream", EventStream(self, first), {"Cache-Control": "no-cache"}
+
+    def publish(self, data):
+        for client in self.clients:
+            client.push(data)
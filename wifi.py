@@ -0,0 +1,166 @@
+# === Non-blocking Wi-Fi bring-up ===
+# The access point comes up first and the server listens on every interface
+# straight away; the station connects in the background with a timeout per
+# attempt and exponential backoff, so a missing upstream SSID never keeps the
+# device from serving AP clients. The last good station settings (IP config
+# and channel) are cached on flash: the next boot skips DHCP and starts the
+# AP on the router's channel, so the radio does not have to switch later.
+# Once the station is up the clock is set over NTP (see clock.py).
+import os
+import json
+import clock
+from compat import ticks_ms, ticks_diff, sleep_ms
+
+CACHE_FILE = "wifi.json"
+CONNECT_TIMEOUT_MS = 15000  # one association + DHCP attempt
+BACKOFF_MIN_MS = 1000
+BACKOFF_MAX_MS = 60000
+POLL_MS = 100               # while connecting or waiting to retry
+LINK_CHECK_MS = 2000        # while connected
+CLOCK_RETRY_MS = 60000      # between NTP attempts while the clock is unset
+
+
+class BootTimer:
+    def __init__(self):
+        self.start = ticks_ms()
+        self.phases = {}  # phase -> ms since the timer was created
+
+    def mark(self, phase):
+        if phase not in self.phases:
+            self.phases[phase] = ticks_diff(ticks_ms(), self.start)
+            print("Boot:", phase, "after", self.phases[phase], "ms")
+
+
+class WifiLink:
+    def __init__(self, sta, ap, ssid, password, ap_essid, ap_password, ap_authmode,
+                 boot=None, cache_file=CACHE_FILE, timeout_ms=CONNECT_TIMEOUT_MS):
+        self.sta = sta
+        self.ap = ap
+        self.ssid = ssid
+        self.password = password
+        self.ap_config = {"essid": ap_essid, "password": ap_password, "authmode": ap_authmode}
+        self.boot = boot
+        self.cache_file = cache_file
+        self.timeout_ms = timeout_ms
+        self.cache = self._load()
+
+        self.state = "idle"  # idle, connecting, connected, backoff
+        self.attempts = 0
+        self.failures = 0    # consecutive failed attempts
+        self.disconnects = 0
+        self._static = False  # current attempt uses the cached IP config
+        self._since = 0
+        self._delay = 0
+        self._clock_tried = None  # ticks_ms of the last NTP attempt
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+            return cache if cache.get("ssid") == self.ssid else None
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, cache):
+        if cache == self.cache:
+            return  # nothing new; spare the flash
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(cache, f)
+            self.cache = cache
+        except OSError as e:
+            print("WiFi cache not saved:", e)
+
+    def _forget(self):
+        self.cache = None
+        try:
+            os.remove(self.cache_file)
+        except OSError:
+            pass
+
+    def start_ap(self):
+        self.ap.active(True)
+        config = dict(self.ap_config)
+        if self.cache and self.cache.get("channel"):
+            config["channel"] = self.cache["channel"]
+        self.ap.config(**config)
+        print("Access Point Active, IP:", self.ap.ifconfig()[0])
+        if self.boot:
+            self.boot.mark("ap")
+
+    def _begin(self):
+        self.sta.active(True)
+        self._static = self.cache is not None and self.failures == 0
+        if self._static:
+            self.sta.ifconfig(tuple(self.cache["ifconfig"]))
+        self.sta.connect(self.ssid, self.password)
+        self.attempts += 1
+        self.state = "connecting"
+        self._since = ticks_ms()
+
+    def _connected(self):
+        self.state = "connected"
+        self.failures = 0
+        ifconfig = list(self.sta.ifconfig())
+        print("Connected! Station IP:", ifconfig[0])
+        if self.boot:
+            self.boot.mark("sta")
+        try:
+            channel = self.sta.config("channel")
+        except (OSError, ValueError):
+            channel = None
+        self._save({"ssid": self.ssid, "ifconfig": ifconfig, "channel": channel})
+        self._sync_clock()
+
+    def _sync_clock(self):
+        if clock.valid():
+            return
+        if self._clock_tried is not None and ticks_diff(ticks_ms(), self._clock_tried) < CLOCK_RETRY_MS:
+            return
+        self._clock_tried = ticks_ms()
+        if clock.sync() and self.boot:
+            self.boot.mark("clock")
+
+    def _failed(self):
+        self.failures += 1
+        self.sta.disconnect()
+        if self._static:
+            # The cached address may be stale; go back to DHCP
+            self._forget()
+            self.sta.active(False)
+        delay = min(BACKOFF_MIN_MS << min(self.failures - 1, 16), BACKOFF_MAX_MS)
+        print("WiFi attempt", self.attempts, "failed, retrying in", delay, "ms")
+        self.state = "backoff"
+        self._since = ticks_ms()
+        self._delay = delay
+
+    # One step of the connection state machine; returns True while connected
+    def poll(self):
+        elapsed = ticks_diff(ticks_ms(), self._since)
+        if self.state == "idle":
+            self._begin()
+        elif self.state == "connecting":
+            if self.sta.isconnected():
+                self._connected()
+            elif elapsed >= self.timeout_ms:
+                self._failed()
+        elif self.state == "backoff":
+            if elapsed >= self._delay:
+                self._begin()
+        elif not self.sta.isconnected():
+            print("WiFi link lost, reconnecting")
+            self.disconnects += 1
+            self.state = "idle"
+        else:
+            self._sync_clock()
+        return self.state == "connected"
+
+    async def run(self):
+        while True:
+            self.poll()
+            await sleep_ms(LINK_CHECK_MS if self.state == "connected" else POLL_MS)
+
+    def status(self):
+        return {"state": self.state, "ip": self.sta.ifconfig()[0] if self.state == "connected" else None,
+                "ap_ip": self.ap.ifconfig()[0], "attempts": self.attempts,
+                "disconnects": self.disconnects, "cached": self.cache is not None, "clock_set": clock.valid()}